@@ -24,7 +24,7 @@ def create_app(config_class=Config):
 
     # Initialize logging
     if not app.debug:
-        handler = RotatingFileHandler('app.log', maxBytes=10240, backupCount=10)
+        handler = RotatingFileHandler(app.config['LOG_FILE'], maxBytes=10240, backupCount=10)
         handler.setLevel(logging.INFO)
         app.logger.addHandler(handler)
         app.logger.info('Application startup')
@@ -36,6 +36,19 @@ def create_app(config_class=Config):
     login_manager.init_app(app)
     limiter.init_app(app)
 
+    from .broadcast import stock_broadcaster
+    stock_broadcaster.init_app(app)
+
+    # Database calls that yield to the eventlet hub; must run before the engine is created
+    from . import cooperative_db
+    cooperative_db.init_app(app, socketio)
+
+    # Connection pragmas and maintenance for SQLite deployments
+    from . import sqlite_profile
+    from .writer import sqlite_writer
+    sqlite_profile.init_app(app, socketio)
+    sqlite_writer.init_app(app)
+
     # Initialize Redis client
     try:
         redis_client = redis.Redis(
@@ -46,7 +59,9 @@ def create_app(config_class=Config):
         )
         app.logger.info('Connected to Redis')
     except redis.ConnectionError:
+        redis_client = None
         app.logger.error("Could not connect to Redis")
+    app.extensions['redis'] = redis_client
 
     # Configure Flask-Limiter to use Redis
     limiter.storage_uri = f"redis://:{app.config['REDIS_PASSWORD']}@{app.config['REDIS_HOST']}:{app.config['REDIS_PORT']}/0"
@@ -62,6 +77,35 @@ def create_app(config_class=Config):
     app.register_blueprint(stock_bp, url_prefix='/stock')
     app.register_blueprint(sales_bp, url_prefix='/sales')
 
+    # Socket.IO event handlers
+    from . import events
+
+    # CLI commands
+    from .rollups import rollups_cli
+    from .hot_stock import hotstock_cli, run_flusher
+    from .ledger import ledger_cli, run_compactor
+    from .search import search_cli
+    app.cli.add_command(rollups_cli)
+    app.cli.add_command(hotstock_cli)
+    app.cli.add_command(ledger_cli)
+    app.cli.add_command(search_cli)
+
+    # Per-worker catalog copy for the sales screen
+    from . import catalog_cache
+    catalog_cache.init_app(app, socketio)
+
+    # Group-commit checkout committer, when CHECKOUT_PIPELINE is set
+    from .pipeline import checkout_pipeline
+    checkout_pipeline.init_app(app)
+
+    # Write-behind flusher for hot-product stock counters
+    if app.config['HOT_STOCK_PRODUCTS']:
+        socketio.start_background_task(run_flusher, app, socketio)
+
+    # Scheduled ledger compaction, so stock levels sum a short movement tail
+    if app.config['LEDGER_COMPACTION_INTERVAL']:
+        socketio.start_background_task(run_compactor, app, socketio)
+
     # User loader for Flask-Login
     from .models import User
 
@@ -1,13 +1,35 @@
 # app/auth.py
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import functools
+from flask import Blueprint, render_template, redirect, url_for, flash, request, session
 from flask_login import login_user, logout_user, login_required, current_user
 from sqlalchemy import func  # Import func from sqlalchemy
-from app.models import User, db, Role, Sale, Product
-from app import limiter
+from app.models import User, db, Role, Sale
+from app import limiter, login_manager
+from app.loading import SALE_SUMMARY
+from app import dashboard_cache
 from werkzeug.security import generate_password_hash, check_password_hash
 
 auth_bp = Blueprint('auth', __name__)
 
+
+def session_login_required(view):
+    """login_required that trusts the signed session's user id instead of loading the user.
+
+    For per-tap endpoints that only need to know a till is signed in and never
+    touch current_user: the users query is skipped. Logging out still ends
+    access at once; a deleted user keeps it until their session ends. Sessions
+    without the id (remember-me) and 'strong' session protection take the
+    normal login_required path.
+    """
+    guarded = login_required(view)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if '_user_id' in session and login_manager.session_protection != 'strong':
+            return view(*args, **kwargs)
+        return guarded(*args, **kwargs)
+    return wrapper
+
 # Route for user registration (admin only)
 @auth_bp.route('/register', methods=['GET', 'POST'])
 @limiter.limit("50 per hour")
@@ -78,23 +100,22 @@ def logout():
 @auth_bp.route('/admin_dashboard')
 @login_required
 def admin_dashboard():
-    # Total sales and revenue
-    total_sales = db.session.query(func.sum(Sale.total)).scalar() or 0
-    total_transactions = db.session.query(func.count(Sale.id)).scalar() or 0
-    total_revenue = db.session.query(func.sum(Sale.total)).scalar() or 0
+    # Totals, monthly trend and low-stock list come from the Redis dashboard
+    # cache in one round trip; a miss falls back to the SQL rollups
+    aggregates, low_stock = dashboard_cache.get_dashboard_data()
+    total_sales = aggregates.get('revenue', 0)
+    total_transactions = int(aggregates.get('transactions', 0))
+    total_revenue = total_sales
 
     # Recent sales (last 5 sales)
-    recent_sales = Sale.query.order_by(Sale.date.desc()).limit(5).all()
+    recent_sales = Sale.query.options(*SALE_SUMMARY).order_by(Sale.date.desc()).limit(5).all()
 
-    # Low stock products (where stock is less than or equal to a threshold, e.g., 10)
-    low_stock_threshold = 10
-    low_stock_products = Product.query.filter(Product.stock <= low_stock_threshold).all()
+    # Low stock products (stock at or below dashboard_cache.LOW_STOCK_THRESHOLD)
+    low_stock_products = sorted(low_stock.values(), key=lambda product: product['stock'])
 
-    # Sales trends (for SQLite, using strftime to truncate by month)
-    sales_by_month = db.session.query(
-        func.strftime('%Y-%m', Sale.date).label('month'), 
-        func.sum(Sale.total).label('total_sales')
-    ).group_by('month').order_by('month').all()
+    sales_by_month = sorted(
+        (field[len('month:'):], total) for field, total in aggregates.items() if field.startswith('month:')
+    )
 
     # Convert sales trends into format suitable for chart (e.g., month names and totals)
     sales_trends_labels = [sale[0] for sale in sales_by_month]  # Formatting as "YYYY-MM"
@@ -0,0 +1,61 @@
+# app/broadcast.py
+import threading
+from app import socketio
+
+LOW_STOCK_THRESHOLD = 5  # Same threshold the POS uses for its low-stock warning
+
+
+def category_room(category_id):
+    """Socket.IO room for terminals currently showing a category."""
+    return f'category:{category_id}'
+
+
+class StockBroadcaster:
+    """Coalesces stock changes into one `stock_updated_batch` emit per category room per window.
+
+    Writers call queue() after they commit; the first change in a window
+    schedules a flush, later changes to the same product overwrite the
+    pending entry, and the flush emits only the latest stock per product id,
+    to the room of the category the product belongs to.
+    """
+
+    def __init__(self, socketio, window=0.15):
+        self.socketio = socketio
+        self.window = window
+        self._pending = {}
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.window = app.config.get('STOCK_BROADCAST_WINDOW', self.window)
+
+    def queue(self, stock_levels):
+        """Queue {'id', 'name', 'stock', 'category_id'} dicts (plus 'deleted' for removals)."""
+        with self._lock:
+            for level in stock_levels:
+                self._pending[(level['category_id'], level['id'])] = level
+            if self._scheduled or not self._pending:
+                return
+            self._scheduled = True
+        self.socketio.start_background_task(self._flush_later)
+
+    def _flush_later(self):
+        self.socketio.sleep(self.window)
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = list(self._pending.values()), {}
+            self._scheduled = False
+        by_category = {}
+        for level in batch:
+            by_category.setdefault(level['category_id'], []).append(level)
+
+        for category_id, products in by_category.items():
+            low_stock = [level for level in products
+                         if level['stock'] < LOW_STOCK_THRESHOLD and not level.get('deleted')]
+            self.socketio.emit('stock_updated_batch', {'products': products, 'low_stock': low_stock},
+                               to=category_room(category_id))
+
+
+stock_broadcaster = StockBroadcaster(socketio)
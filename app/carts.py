@@ -0,0 +1,102 @@
+# app/carts.py
+"""Server-side carts: one Redis hash per terminal cart, product id -> quantity.
+
+add_to_cart writes the line once its reservation is taken, so a till's cart
+and its reservations move together, and checkout sends only the cart id.
+Only quantities are stored. Names and prices come from the in-memory catalog
+(app.catalog_cache) whenever the cart is read or sold, so they are always
+current and nothing is re-sent.
+
+The cart id lives in the terminal's session. It is issued by issue_id() when
+the sales screen loads, never by a tap: two first taps in flight together
+would each make their own id, and the session cookie keeps only one of
+them. Selling a cart replaces its id with a fresh one, so an old id can
+never be sold twice. A cart expires with the reservations, RESERVATION_TTL
+seconds after its last change.
+"""
+from uuid import uuid4
+from flask import current_app, session
+from redis import RedisError
+
+# ARGV[1]: product id, ARGV[2]: quantity to take off, or 0 to drop the whole line
+_REMOVE = """
+local remaining = redis.call('HINCRBY', KEYS[1], ARGV[1], -tonumber(ARGV[2]))
+if tonumber(ARGV[2]) <= 0 or remaining <= 0 then redis.call('HDEL', KEYS[1], ARGV[1]) end
+return 1
+"""
+
+
+class CartUnavailable(Exception):
+    """Redis could not be reached; the till sends its cart lines with the checkout instead."""
+
+
+def _key(cart_id):
+    return f'cart:{cart_id}'
+
+
+def _redis():
+    client = current_app.extensions.get('redis')
+    if client is None:
+        raise CartUnavailable()
+    return client
+
+
+def current_id():
+    """Id of this terminal's open cart, or None if it has none."""
+    return session.get('cart_id')
+
+
+def issue_id():
+    """Issue this terminal's cart id if it has none yet. Returns the id."""
+    if 'cart_id' not in session:
+        session['cart_id'] = uuid4().hex
+    return session['cart_id']
+
+
+def add(product_id, quantity):
+    """Add units to this terminal's cart. Returns the cart id.
+
+    A terminal that never opened a cart gets CartUnavailable and sends its
+    lines at checkout.
+    """
+    cart_id = current_id()
+    if cart_id is None:
+        raise CartUnavailable()
+    try:
+        pipe = _redis().pipeline(transaction=True)
+        pipe.hincrby(_key(cart_id), product_id, quantity)
+        pipe.expire(_key(cart_id), current_app.config['RESERVATION_TTL'])
+        pipe.execute()
+    except RedisError:
+        raise CartUnavailable()
+    return cart_id
+
+
+def remove(product_id, quantity=0):
+    """Take units off a line, or the whole line when quantity is 0."""
+    cart_id = current_id()
+    if cart_id is None:
+        return
+    try:
+        _redis().eval(_REMOVE, 1, _key(cart_id), product_id, quantity)
+    except RedisError:
+        raise CartUnavailable()
+
+
+def lines(cart_id):
+    """{product_id: quantity} for a cart; empty once it has expired or been sold."""
+    try:
+        stored = _redis().hgetall(_key(cart_id))
+    except RedisError:
+        raise CartUnavailable()
+    return {int(product_id): int(quantity) for product_id, quantity in stored.items() if int(quantity) > 0}
+
+
+def close(cart_id):
+    """Forget a sold cart and issue the terminal's id for its next sale."""
+    if session.get('cart_id') == cart_id:
+        session['cart_id'] = uuid4().hex
+    try:
+        _redis().delete(_key(cart_id))
+    except (RedisError, CartUnavailable):
+        current_app.logger.error('Could not delete a sold cart; it expires on its own')
@@ -0,0 +1,135 @@
+# app/catalog.py
+"""Monotonic catalog version for delta sync.
+
+Every product or stock write calls mark_changed()/mark_deleted() inside its
+transaction, just before commit, and stamps the rows it wrote. Readers are
+given a version and later ask for the rows stamped above it, so no change
+may commit with a stamp at or below a version a reader has been given.
+
+On SQLite the stamp comes from a counter row. SQLite runs one write
+transaction at a time, so the bump adds no waiting and versions become
+visible in commit order.
+
+On PostgreSQL a counter row would make every checkout wait for the one
+before it to commit. The stamp is the writing transaction's id instead
+(txid_current()), which the server hands out without a lock. Those ids do
+not commit in order, so the version readers are given is not the highest
+stamp they can see but the horizon: their snapshot's xmin less one. Every
+transaction below xmin has finished, so nothing can still commit at or
+below the horizon. Rows already committed above it are returned again on
+the next sync, never skipped.
+
+The category list and product names change only on admin writes and use
+counter rows on both databases.
+"""
+from sqlalchemy import update, select, func
+from app.models import db, Product, CatalogState, CatalogTombstone
+
+# catalog_state rows
+STATE_ID = 1  # Products and stock
+CATEGORIES_STATE_ID = 2  # The category list itself
+NAMES_STATE_ID = 3  # Product renames and deletions, which change report labels
+
+
+def _stamped_by_transaction(state_id=STATE_ID):
+    return state_id == STATE_ID and db.engine.dialect.name == 'postgresql'
+
+
+def bump_version(state_id=STATE_ID):
+    """Return a new catalog version for the current transaction to stamp its writes with."""
+    if _stamped_by_transaction(state_id):
+        return db.session.execute(select(func.txid_current())).scalar()
+    result = db.session.execute(
+        update(CatalogState).where(CatalogState.id == state_id).values(version=CatalogState.version + 1)
+    )
+    if result.rowcount == 0:
+        db.session.add(CatalogState(id=state_id, version=1))
+        db.session.flush()
+    return db.session.execute(select(CatalogState.version).where(CatalogState.id == state_id)).scalar()
+
+
+def current_version(state_id=STATE_ID):
+    """The highest version no write can still commit at or below."""
+    if _stamped_by_transaction(state_id):
+        return db.session.execute(select(func.txid_snapshot_xmin(func.txid_current_snapshot()) - 1)).scalar()
+    return db.session.execute(select(CatalogState.version).where(CatalogState.id == state_id)).scalar() or 0
+
+
+def category_version(category_id):
+    """Latest catalog version that touched a category, from two index-only lookups."""
+    written = select(func.max(Product.catalog_version)).where(Product.category_id == category_id)
+    deleted = select(func.max(CatalogTombstone.version)).where(CatalogTombstone.category_id == category_id)
+    row = db.session.execute(select(written.scalar_subquery(), deleted.scalar_subquery())).one()
+    newest = max(row[0] or 0, row[1] or 0)
+    if not _stamped_by_transaction():
+        return newest
+    return etag_version(newest, current_version())
+
+
+def etag_version(newest, horizon):
+    """What a category's ETag carries, from its newest stamp and the reader's current_version().
+
+    While the newest stamp is above the horizon, a write stamped below it can
+    still commit into the category without raising it. So the horizon goes in
+    too. Such a write shows in the ETag once every transaction older than it
+    has finished.
+    """
+    if newest <= horizon or not _stamped_by_transaction():
+        return newest
+    return f'{newest}.{horizon}'
+
+
+def mark_changed(product_ids):
+    """Stamp written products with a new catalog version."""
+    product_ids = list(product_ids)
+    if not product_ids:
+        return None
+    version = bump_version()
+    db.session.execute(
+        update(Product).where(Product.id.in_(product_ids)).values(catalog_version=version)
+        .execution_options(synchronize_session=False)
+    )
+    return version
+
+
+def mark_moved(product_id, old_category_id):
+    """Stamp a product that changed category; the tombstone retires it from the old one."""
+    version = mark_changed([product_id])
+    db.session.add(CatalogTombstone(product_id=product_id, category_id=old_category_id, version=version))
+    return version
+
+
+def mark_deleted(product):
+    """Record a tombstone so clients drop the product on their next sync."""
+    version = bump_version()
+    db.session.add(CatalogTombstone(product_id=product.id, category_id=product.category_id, version=version))
+    return version
+
+
+def changes_since(since):
+    """Products written and tombstones recorded after `since`, plus the version to resume from.
+
+    since=0 returns the full catalog. Clients apply `deleted` before `products`,
+    since a reused id can appear in both.
+    """
+    # Read the version first: a write committed after this point is returned
+    # again on the next sync, never skipped
+    version = current_version()
+    products = db.session.query(
+        Product.id, Product.name, Product.price, Product.stock, Product.category_id
+    )
+    if since > 0:
+        products = products.filter(Product.catalog_version > since)
+    products = products.order_by(Product.id).all()
+    deleted = db.session.query(CatalogTombstone.product_id).filter(
+        CatalogTombstone.version > since
+    ).all() if since > 0 else []
+
+    return {
+        'version': version,
+        'products': [
+            {'id': p.id, 'name': p.name, 'price': p.price, 'stock': p.stock, 'category_id': p.category_id}
+            for p in products
+        ],
+        'deleted': [row.product_id for row in deleted],
+    }
@@ -0,0 +1,314 @@
+# app/catalog_cache.py
+"""Per-worker copy of the product catalog for the sales screen's read paths.
+
+With CATALOG_CACHE set, each app holds every product as a small tuple keyed
+by id, the product ids of each category, and the category list, loaded once
+from the database. After committing, writers call publish() with the
+catalog version their transaction stamped. The version goes to this worker's
+copy directly and to the others over the CHANNEL pub/sub channel. A copy that
+is behind a published version applies catalog.changes since its own version:
+one indexed query that returns only the rows written since then. Nothing is
+reloaded wholesale.
+
+The copy also carries the type-ahead index (app.typeahead), built with the
+products and kept in step with their names by the same deltas. Its ranking
+is recomputed from recent sales every TYPEAHEAD_RANKING_INTERVAL seconds.
+
+A copy keeps asking for an announced version until the database shows it,
+so a message that arrives before its commit is visible is not lost. Between
+announcements it asks at most every BEHIND_RETRY_INTERVAL seconds and serves
+what it has meanwhile, so a PostgreSQL horizon held back by a long report
+does not send every read to SQL. Every CATALOG_CACHE_CHECK_INTERVAL seconds,
+and on every read while the subscriber is disconnected, the copy compares
+its versions with catalog.current_version(). A worker that missed a message
+therefore catches up on the next check. In steady state a read never
+touches SQL.
+
+With the cache off, the same functions read from the database, so callers
+do not branch.
+"""
+import threading
+import time
+from collections import namedtuple
+from flask import current_app
+from redis import RedisError
+from sqlalchemy import func
+from app.models import db, Product, Category, CatalogTombstone
+from app import catalog, search, socketio, typeahead as prefix_index
+
+CHANNEL = 'catalog:invalidate'
+POLL_INTERVAL = 0.05  # Seconds between channel checks; non-blocking so an unpatched eventlet hub never stalls
+BEHIND_RETRY_INTERVAL = 1.0  # Seconds between re-syncs while an announced version is not visible yet
+
+# Scopes published on the channel, as '<scope>:<version>'
+PRODUCTS = 'products'
+CATEGORIES = 'categories'
+
+CachedProduct = namedtuple('CachedProduct', 'id name price stock category_id')
+CachedCategory = namedtuple('CachedCategory', 'id name')
+
+
+class _Snapshot:
+    def __init__(self):
+        self.products = {}  # id -> CachedProduct
+        self.by_category = {}  # category id -> tuple of product ids
+        self.category_versions = {}  # category id -> latest catalog version that touched it
+        self.categories = ()  # CachedCategory tuples, by id
+        self.typeahead = prefix_index.PrefixIndex()
+        self.ranked_at = 0.0  # When the type-ahead ranking last read recent sales
+        self.versions = {PRODUCTS: None, CATEGORIES: None}  # None until loaded
+        self.wanted = {PRODUCTS: 0, CATEGORIES: 0}  # Highest version announced for each scope
+        self.checked_at = 0.0
+        self.retry_at = 0.0  # Until then, a copy still behind the announced versions is served as it is
+        self.listening = False
+        self.lock = threading.Lock()
+
+    def announce(self, scope, version):
+        if scope in self.wanted and version > self.wanted[scope]:
+            self.wanted[scope] = version
+            self.retry_at = 0.0  # A new write is worth one sync straight away
+
+    def loaded(self):
+        return all(version is not None for version in self.versions.values())
+
+
+def init_app(app, socketio):
+    if not app.config['CATALOG_CACHE']:
+        return
+    snapshot = app.extensions['catalog_cache'] = _Snapshot()
+    socketio.start_background_task(_listen, app, socketio, snapshot)
+
+
+def _snapshot():
+    return current_app.extensions.get('catalog_cache')
+
+
+def publish(scope, version):
+    """Announce a committed catalog write; `version` is what catalog stamped in its transaction."""
+    if version is None:
+        return
+    snapshot = _snapshot()
+    if snapshot is None:
+        return
+    snapshot.announce(scope, version)
+    client = current_app.extensions.get('redis')
+    if client is None:
+        return
+    try:
+        client.publish(CHANNEL, f'{scope}:{version}')
+    except RedisError:
+        current_app.logger.error('Could not publish a catalog invalidation; other workers resync on their next check')
+
+
+def _listen(app, socketio, snapshot):
+    """Background loop: fold versions published by other workers into this worker's snapshot."""
+    pubsub = None
+    while True:
+        try:
+            if pubsub is None:
+                client = app.extensions.get('redis')
+                if client is not None:
+                    pubsub = client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(CHANNEL)
+                    snapshot.listening = True
+                    snapshot.checked_at = 0.0  # Messages sent before the subscription are found by a check
+            message = pubsub.get_message() if pubsub is not None else None
+            while message is not None:
+                scope, _, version = message['data'].partition(':')
+                if version.isdigit():
+                    snapshot.announce(scope, int(version))
+                message = pubsub.get_message()
+        except RedisError:
+            if snapshot.listening:
+                app.logger.error('Catalog invalidation channel lost; checking versions on every read until it is back')
+            snapshot.listening = False
+            pubsub = None
+            socketio.sleep(5)
+        socketio.sleep(POLL_INTERVAL)
+
+
+def _current(snapshot):
+    """Bring the snapshot up to the announced versions; returns it ready to read."""
+    now = time.monotonic()
+    if not snapshot.listening or now - snapshot.checked_at >= current_app.config['CATALOG_CACHE_CHECK_INTERVAL']:
+        snapshot.checked_at = now
+        # The database is the truth here: this also drops a version announced by a write that rolled back
+        snapshot.wanted[PRODUCTS] = catalog.current_version()
+        snapshot.wanted[CATEGORIES] = catalog.current_version(catalog.CATEGORIES_STATE_ID)
+
+    if snapshot.loaded() and (now < snapshot.retry_at or not _behind(snapshot)):
+        return snapshot
+    # One task refreshes at a time; the others keep reading the previous copy unless there is none yet
+    while not snapshot.lock.acquire(blocking=False):
+        if snapshot.loaded():
+            return snapshot
+        socketio.sleep(0.01)
+    try:
+        if snapshot.versions[PRODUCTS] is None:
+            _load_products(snapshot)
+        elif snapshot.versions[PRODUCTS] < snapshot.wanted[PRODUCTS]:
+            _apply_changes(snapshot)
+        if snapshot.versions[CATEGORIES] is None or snapshot.versions[CATEGORIES] < snapshot.wanted[CATEGORIES]:
+            _load_categories(snapshot)
+        # Still behind: the write is not visible yet, or on PostgreSQL the horizon is held back by a
+        # long transaction. Retry after a pause rather than on every read
+        snapshot.retry_at = now + BEHIND_RETRY_INTERVAL if _behind(snapshot) else 0.0
+    finally:
+        snapshot.lock.release()
+    return snapshot
+
+
+def _behind(snapshot):
+    return any(snapshot.versions[scope] < wanted for scope, wanted in snapshot.wanted.items())
+
+
+def _load_products(snapshot):
+    version = catalog.current_version()  # Read first, like catalog.changes_since
+    rows = db.session.query(
+        Product.id, Product.name, Product.price, Product.stock, Product.category_id, Product.catalog_version
+    ).order_by(Product.id).all()
+    products, members, category_versions = {}, {}, {}
+    for row in rows:
+        products[row.id] = CachedProduct(row.id, row.name, row.price, row.stock, row.category_id)
+        members.setdefault(row.category_id, []).append(row.id)
+        category_versions[row.category_id] = max(category_versions.get(row.category_id, 0), row.catalog_version)
+    tombstones = db.session.query(CatalogTombstone.category_id, func.max(CatalogTombstone.version)).group_by(
+        CatalogTombstone.category_id).all()
+    for category_id, tombstone_version in tombstones:
+        category_versions[category_id] = max(category_versions.get(category_id, 0), tombstone_version)
+
+    snapshot.products = products
+    snapshot.by_category = {category_id: tuple(ids) for category_id, ids in members.items()}
+    snapshot.category_versions = category_versions
+    snapshot.typeahead = prefix_index.PrefixIndex(
+        ((product.id, product.name) for product in products.values()), _recent_sales())
+    snapshot.ranked_at = time.monotonic()
+    snapshot.versions[PRODUCTS] = version
+
+
+def _recent_sales():
+    return prefix_index.recent_sales(current_app.config['TYPEAHEAD_VELOCITY_DAYS'])
+
+
+def _apply_changes(snapshot):
+    """Fold in the products and tombstones stamped after the snapshot's version."""
+    since = snapshot.versions[PRODUCTS]
+    version = catalog.current_version()
+    rows = db.session.query(
+        Product.id, Product.name, Product.price, Product.stock, Product.category_id, Product.catalog_version
+    ).filter(Product.catalog_version > since).all()
+    tombstones = db.session.query(
+        CatalogTombstone.product_id, CatalogTombstone.category_id, CatalogTombstone.version
+    ).filter(CatalogTombstone.version > since).all()
+
+    by_id, by_category, category_versions = snapshot.products, dict(snapshot.by_category), \
+        dict(snapshot.category_versions)
+    deleted, named = [], []  # For the type-ahead index
+
+    def touch(category_id, stamp):
+        category_versions[category_id] = max(category_versions.get(category_id, 0), stamp)
+
+    # Tombstones first: a reused id can appear in both
+    for tombstone in tombstones:
+        touch(tombstone.category_id, tombstone.version)
+        cached = by_id.get(tombstone.product_id)
+        if cached is not None and cached.category_id == tombstone.category_id:
+            del by_id[tombstone.product_id]
+            deleted.append(tombstone.product_id)
+            by_category[cached.category_id] = tuple(
+                pid for pid in by_category.get(cached.category_id, ()) if pid != cached.id)
+    for row in rows:
+        touch(row.category_id, row.catalog_version)
+        cached = by_id.get(row.id)
+        if cached is not None and cached.category_id != row.category_id:
+            by_category[cached.category_id] = tuple(
+                pid for pid in by_category.get(cached.category_id, ()) if pid != row.id)
+        if cached is None or cached.category_id != row.category_id:
+            by_category[row.category_id] = by_category.get(row.category_id, ()) + (row.id, )
+        if row.id not in by_id or by_id[row.id].name != row.name:
+            named.append((row.id, row.name))
+        by_id[row.id] = CachedProduct(row.id, row.name, row.price, row.stock, row.category_id)
+
+    # Readers only ever see whole category tuples and version maps
+    snapshot.by_category = by_category
+    snapshot.category_versions = category_versions
+    snapshot.typeahead = snapshot.typeahead.updated(deleted, named)
+    snapshot.versions[PRODUCTS] = max(since, version)
+
+
+def _load_categories(snapshot):
+    version = catalog.current_version(catalog.CATEGORIES_STATE_ID)
+    rows = db.session.query(Category.id, Category.name).order_by(Category.id).all()
+    snapshot.categories = tuple(CachedCategory(row.id, row.name) for row in rows)
+    snapshot.versions[CATEGORIES] = version
+
+
+def products(product_ids):
+    """{id: product} for the ids that exist; products carry id, name, price, stock and category_id."""
+    snapshot = _snapshot()
+    if snapshot is None:
+        rows = db.session.query(Product.id, Product.name, Product.price, Product.stock, Product.category_id).filter(
+            Product.id.in_(list(product_ids))).all()
+        return {row.id: CachedProduct(*row) for row in rows}
+    cached = _current(snapshot).products
+    return {pid: cached[pid] for pid in product_ids if pid in cached}
+
+
+def product(product_id):
+    return products([product_id]).get(product_id)
+
+
+def category_products(category_id):
+    """Products of one category, by id."""
+    snapshot = _snapshot()
+    if snapshot is None:
+        rows = db.session.query(Product.id, Product.name, Product.price, Product.stock, Product.category_id).filter(
+            Product.category_id == category_id).order_by(Product.id).all()
+        return [CachedProduct(*row) for row in rows]
+    snapshot = _current(snapshot)
+    cached = snapshot.products
+    return sorted((cached[pid] for pid in snapshot.by_category.get(category_id, ()) if pid in cached),
+                  key=lambda product: product.id)
+
+
+def category_version(category_id):
+    """Same value as catalog.category_version, so ETags agree across workers."""
+    snapshot = _snapshot()
+    if snapshot is None:
+        return catalog.category_version(category_id)
+    snapshot = _current(snapshot)
+    return catalog.etag_version(snapshot.category_versions.get(category_id, 0), snapshot.versions[PRODUCTS])
+
+
+def categories():
+    """Every category, by id."""
+    snapshot = _snapshot()
+    if snapshot is None:
+        return [CachedCategory(*row) for row in db.session.query(Category.id, Category.name).order_by(Category.id)]
+    return list(_current(snapshot).categories)
+
+
+def categories_version():
+    snapshot = _snapshot()
+    if snapshot is None:
+        return catalog.current_version(catalog.CATEGORIES_STATE_ID)
+    return _current(snapshot).versions[CATEGORIES]
+
+
+def typeahead(query, limit=prefix_index.TOP_K):
+    """Best-selling products with a name word starting with `query`, best first."""
+    snapshot = _snapshot()
+    if snapshot is None:
+        product_ids = search.product_ids(query, limit)  # Substring search; needs three characters
+        found = products(product_ids)
+        return [found[pid] for pid in product_ids if pid in found]
+    snapshot = _current(snapshot)
+    stale = time.monotonic() - snapshot.ranked_at >= current_app.config['TYPEAHEAD_RANKING_INTERVAL']
+    if stale and snapshot.lock.acquire(blocking=False):
+        try:
+            snapshot.typeahead = snapshot.typeahead.reranked(_recent_sales())
+            snapshot.ranked_at = time.monotonic()
+        finally:
+            snapshot.lock.release()
+    cached = snapshot.products
+    return [cached[pid] for pid in snapshot.typeahead.lookup(query, limit) if pid in cached]
@@ -0,0 +1,295 @@
+# app/checkout.py
+from datetime import datetime, timezone
+from uuid import uuid4
+from sqlalchemy import update, bindparam
+from app.models import db, Product, Sale, CartItem, MovementKind
+from app import rollups, dashboard_cache, catalog, catalog_cache, hot_stock, ledger
+from app.writer import sqlite_writer
+
+MAX_BATCH_SALES = 500  # Upper bound on sales in one offline-queue flush
+
+
+class CheckoutError(Exception):
+    """Base error for a sale that cannot be completed."""
+    status_code = 400
+
+
+class ProductNotFound(CheckoutError):
+    status_code = 404
+
+
+class StockConflict(CheckoutError):
+    status_code = 409
+
+
+class InsufficientStock(CheckoutError):
+    def __init__(self, product):
+        super().__init__(f'Insufficient stock for {product.name}')
+        self.product = product
+
+
+def normalize_cart(cart):
+    """Merge repeated cart lines into {product_id: quantity}, validating quantities."""
+    lines = {}
+    for item in cart:
+        try:
+            product_id = int(item['id'])  # The POS sends the product id as 'id'
+            quantity = int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise CheckoutError('Invalid cart line')
+        if quantity <= 0:
+            raise CheckoutError('Quantity must be positive')
+        lines[product_id] = lines.get(product_id, 0) + quantity
+    return lines
+
+
+def load_products(product_ids):
+    """Fetch every product in the cart with a single IN query."""
+    products = Product.query.filter(Product.id.in_(product_ids)).all()
+    return {product.id: product for product in products}
+
+
+def decrement_stock(product_id, quantity):
+    """Conditionally take stock from one product; returns False if the line is short."""
+    result = db.session.execute(
+        update(Product)
+        .where(Product.id == product_id, Product.stock >= quantity)
+        .values(stock=Product.stock - quantity, version_id=Product.version_id + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+def place_sale(cart, payment_method='cash', customer_name=None, idempotency_key=None):
+    """Price, decrement and record a sale in one transaction.
+
+    Returns the committed Sale and a list of {'id', 'name', 'stock', 'category_id'} dicts holding the
+    post-sale stock of every touched product.
+    Raises CheckoutError (and rolls back) if any line cannot be fulfilled, and IntegrityError if
+    another request already committed a sale with the same idempotency_key.
+    """
+    lines = normalize_cart(cart)
+    if not lines:
+        raise CheckoutError('Cart is empty')
+
+    # Names, prices and categories only; stock is checked by the guarded UPDATEs below
+    products = catalog_cache.products(lines.keys())
+    missing = set(lines) - set(products)
+    if missing:
+        raise ProductNotFound('Product not found')
+
+    total_amount = sum(products[pid].price * quantity for pid, quantity in lines.items())
+    sale_date = datetime.utcnow()
+    sale = Sale(date=sale_date, total=total_amount, payment_method=payment_method,
+                customer_name=customer_name if payment_method == 'credit' else None,
+                idempotency_key=idempotency_key)
+
+    # Hot products take stock from their Redis counters; the products rows are updated by the flusher
+    hot_lines = {pid: quantity for pid, quantity in lines.items() if hot_stock.is_hot(pid)}
+    hot_levels = {}
+    if hot_lines:
+        try:
+            hot_levels = hot_stock.take(hot_lines)
+        except hot_stock.ShortLine as e:
+            raise InsufficientStock(products[e.product_id])
+        except hot_stock.Unavailable:
+            hot_lines = {}  # No Redis: decrement these rows directly like any other product
+    cold_ids = [pid for pid in lines if pid not in hot_lines]
+
+    try:
+        # Lock rows in a stable order so concurrent tills cannot deadlock each other
+        for product_id in sorted(cold_ids):
+            if not decrement_stock(product_id, lines[product_id]):
+                raise InsufficientStock(products[product_id])
+
+        sale.cart_items = [CartItem(product_id=pid, quantity=quantity, unit_price=products[pid].price,
+                                    stock_pending=pid in hot_lines)
+                           for pid, quantity in lines.items()]
+        db.session.add(sale)
+        db.session.flush()  # Assigns sale.id for the ledger
+        ledger.record([ledger.movement(pid, MovementKind.SALE, -quantity, sale_id=sale.id)
+                       for pid, quantity in lines.items()])
+        rollups.record_sale(sale_date, lines, products)
+
+        # Read the post-decrement stock in one query, inside the transaction that made it
+        refreshed = db.session.query(Product.id, Product.stock).filter(Product.id.in_(cold_ids)).all() \
+            if cold_ids else []
+        levels = dict(refreshed)
+        levels.update(hot_levels)
+        stock_levels = [{'id': pid, 'name': products[pid].name, 'stock': stock,
+                         'category_id': products[pid].category_id} for pid, stock in levels.items()]
+        version = catalog.mark_changed(cold_ids)  # Last, so a counter row's lock is held briefly
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if hot_lines:
+            hot_stock.give_back(hot_lines)
+        raise
+
+    if hot_lines:
+        sqlite_writer.after_rollback(hot_stock.give_back, hot_lines)
+
+    @sqlite_writer.after_commit
+    def published():
+        hot_stock.mark_dirty(cold_ids)  # Hot lines that fell back to their rows
+        catalog_cache.publish(catalog_cache.PRODUCTS, version)
+        dashboard_cache.record_sale(sale_date, total_amount, stock_levels)
+    return sale, stock_levels
+
+
+def _batch_entry(entry):
+    """Validate one queued sale; returns (lines, payment_method, customer_name, key, sale_date)."""
+    if not isinstance(entry, dict):
+        raise CheckoutError('Invalid sale')
+    lines = normalize_cart(entry.get('cart') or [])
+    if not lines:
+        raise CheckoutError('Cart is empty')
+    key = entry.get('idempotency_key')
+    if key is not None and not (isinstance(key, str) and 0 < len(key) <= 64):
+        raise CheckoutError('Invalid idempotency_key')
+    sale_date = datetime.utcnow()
+    if entry.get('date'):
+        # Queued sales keep the time they were rung up; naive timestamps are UTC, others are converted
+        try:
+            rung_up = datetime.fromisoformat(entry['date'])
+        except (TypeError, ValueError):
+            raise CheckoutError('Invalid sale date')
+        if rung_up.tzinfo is not None:
+            rung_up = rung_up.astimezone(timezone.utc).replace(tzinfo=None)
+        sale_date = min(rung_up, sale_date)
+    payment_method = entry.get('payment_method', 'cash')
+    customer_name = entry.get('customer_name') if payment_method == 'credit' else None
+    return lines, payment_method, customer_name, key or uuid4().hex, sale_date
+
+
+def place_sales(entries):
+    """Record a batch of queued sales in one transaction.
+
+    Every sale is validated against one bulk product load and a running stock
+    tally; sales that cannot be fulfilled are rejected on their own without
+    failing the batch. Accepted sales and their cart_items are inserted with
+    executemany, and stock is reconciled with one guarded UPDATE per product.
+    Sales whose idempotency_key was already used are reported as replays.
+
+    Returns (results, stock_levels): one {'success', 'sale_id' | 'message'} dict per entry,
+    in order, and the post-batch stock of every product the batch touched.
+    Raises StockConflict if other tills drained stock mid-batch; nothing is recorded then.
+    """
+    results = [None] * len(entries)
+    parsed = {}
+    for index, entry in enumerate(entries):
+        try:
+            parsed[index] = _batch_entry(entry)
+        except CheckoutError as e:
+            results[index] = {'success': False, 'message': str(e)}
+
+    keys = [sale[3] for sale in parsed.values()]
+    known = dict(db.session.query(Sale.idempotency_key, Sale.id).filter(Sale.idempotency_key.in_(keys)).all()) \
+        if keys else {}
+    product_ids = {pid for sale in parsed.values() for pid in sale[0]}
+    products = load_products(product_ids) if product_ids else {}
+    remaining = {pid: product.stock for pid, product in products.items()}
+
+    accepted, seen_keys = [], {}
+    cold_deltas, hot_taken, hot_levels = {}, {}, {}
+    for index, (lines, payment_method, customer_name, key, sale_date) in parsed.items():
+        if key in known:
+            results[index] = {'success': True, 'sale_id': known[key], 'replayed': True}
+            continue
+        if key in seen_keys:
+            seen_keys[key].append(index)  # Same sale queued twice; answered with the first copy's id
+            continue
+        missing = [pid for pid in lines if pid not in products]
+        if missing:
+            results[index] = {'success': False, 'message': 'Product not found'}
+            continue
+
+        hot_lines = {pid: quantity for pid, quantity in lines.items() if hot_stock.is_hot(pid)}
+        cold_lines = {pid: quantity for pid, quantity in lines.items() if pid not in hot_lines}
+        short = next((pid for pid, quantity in cold_lines.items() if remaining[pid] < quantity), None)
+        if short is None and hot_lines:
+            try:
+                hot_levels.update(hot_stock.take(hot_lines))
+            except hot_stock.ShortLine as e:
+                short = e.product_id
+            except hot_stock.Unavailable:
+                short = next((pid for pid, quantity in hot_lines.items() if remaining[pid] < quantity), None)
+                cold_lines, hot_lines = lines, {}
+        if short is not None:
+            results[index] = {'success': False, 'message': f'Insufficient stock for {products[short].name}'}
+            continue
+
+        for pid, quantity in cold_lines.items():
+            remaining[pid] -= quantity
+            cold_deltas[pid] = cold_deltas.get(pid, 0) + quantity
+        for pid, quantity in hot_lines.items():
+            hot_taken[pid] = hot_taken.get(pid, 0) + quantity
+        total = sum(products[pid].price * quantity for pid, quantity in lines.items())
+        accepted.append((index, lines, hot_lines, payment_method, customer_name, key, sale_date, total))
+        seen_keys[key] = [index]
+
+    if not accepted:
+        return results, []
+
+    sales_table, items_table = Sale.__table__, CartItem.__table__
+    try:
+        # One guarded UPDATE per product, in id order; a short rowcount means another till got there first
+        updated = db.session.execute(
+            update(Product.__table__)
+            .where(Product.__table__.c.id == bindparam('pid'), Product.__table__.c.stock >= bindparam('delta'))
+            .values(stock=Product.__table__.c.stock - bindparam('delta'),
+                    version_id=Product.__table__.c.version_id + 1),
+            [{'pid': pid, 'delta': delta} for pid, delta in sorted(cold_deltas.items())]
+        ) if cold_deltas else None
+        if updated is not None and updated.rowcount != len(cold_deltas):
+            raise StockConflict('Stock changed while the batch was being recorded; retry the batch')
+
+        db.session.execute(sales_table.insert(), [
+            {'date': sale_date, 'total': total, 'payment_method': payment_method,
+             'customer_name': customer_name, 'idempotency_key': key}
+            for _, _, _, payment_method, customer_name, key, sale_date, total in accepted
+        ])
+        # The idempotency keys are unique, so they map the executemany rows back to their ids
+        sale_ids = dict(db.session.query(Sale.idempotency_key, Sale.id).filter(
+            Sale.idempotency_key.in_([sale[5] for sale in accepted])).all())
+        db.session.execute(items_table.insert(), [
+            {'sale_id': sale_ids[key], 'product_id': pid, 'quantity': quantity,
+             'unit_price': products[pid].price, 'stock_pending': pid in hot_lines}
+            for _, lines, hot_lines, _, _, key, _, _ in accepted
+            for pid, quantity in lines.items()
+        ])
+        ledger.record([ledger.movement(pid, MovementKind.SALE, -quantity, sale_id=sale_ids[key])
+                       for _, lines, _, _, _, key, _, _ in accepted
+                       for pid, quantity in lines.items()])
+        rollups.record_sales([(sale[6], sale[1]) for sale in accepted], products)
+
+        # Post-batch stock of the database-backed products in one query, like place_sale
+        if cold_deltas:
+            remaining.update(db.session.query(Product.id, Product.stock).filter(Product.id.in_(cold_deltas)).all())
+        version = catalog.mark_changed(cold_deltas.keys())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if hot_taken:
+            hot_stock.give_back(hot_taken)
+        raise
+
+    for sale in accepted:
+        first, *copies = seen_keys[sale[5]]
+        results[first] = {'success': True, 'sale_id': sale_ids[sale[5]]}
+        for index in copies:
+            results[index] = {'success': True, 'sale_id': sale_ids[sale[5]], 'replayed': True}
+
+    touched = set(cold_deltas) | set(hot_taken)
+    stock_levels = [{'id': pid, 'name': products[pid].name,
+                     'stock': hot_levels[pid] if pid in hot_taken else remaining[pid],
+                     'category_id': products[pid].category_id} for pid in sorted(touched)]
+    if hot_taken:
+        sqlite_writer.after_rollback(hot_stock.give_back, hot_taken)
+
+    @sqlite_writer.after_commit
+    def published():
+        hot_stock.mark_dirty(cold_deltas)  # Hot lines that fell back to their rows
+        catalog_cache.publish(catalog_cache.PRODUCTS, version)
+        dashboard_cache.record_sales([(sale[6], sale[7]) for sale in accepted], stock_levels)
+    return results, stock_levels
@@ -0,0 +1,33 @@
+# app/concurrency.py
+import functools
+import random
+from flask import current_app
+from sqlalchemy.orm.exc import StaleDataError
+from app import db, socketio
+
+RETRY_ATTEMPTS = 5
+
+
+def retry_on_stale(view=None, attempts=RETRY_ATTEMPTS):
+    """Re-run a view whose read-modify-write lost a race on a versioned row.
+
+    Product carries a version_id_col, so an ORM UPDATE built from a stale read
+    matches no row and raises StaleDataError. The session is rolled back and
+    the whole view runs again, re-reading the row and re-applying its change.
+    The last failure propagates.
+    """
+    if view is None:
+        return functools.partial(retry_on_stale, attempts=attempts)
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, attempts + 1):
+            try:
+                return view(*args, **kwargs)
+            except StaleDataError:
+                db.session.rollback()
+                if attempt == attempts:
+                    raise
+                current_app.logger.info(f'{view.__name__}: concurrent write, retrying ({attempt}/{attempts})')
+                socketio.sleep(random.uniform(0, 0.005 * attempt))  # Jitter so retries do not collide again
+    return wrapper
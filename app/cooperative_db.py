@@ -0,0 +1,61 @@
+# app/cooperative_db.py
+"""Keep database calls from blocking the eventlet hub.
+
+app.py serves on eventlet without monkey-patching, and the database drivers
+block in C, so one slow query used to freeze every websocket and every
+checkout on the worker. With COOPERATIVE_DB set and Socket.IO running on
+eventlet:
+
+  Postgres  psycopg2 gets a wait callback that yields to the hub while the
+            server works, the same technique psycogreen uses.
+  SQLite    connections are wrapped in eventlet.tpool proxies, so each call
+            runs on a native thread while other greenthreads carry on.
+"""
+import functools
+import sqlite3
+from sqlalchemy.engine import make_url
+
+
+def init_app(app, socketio):
+    """Call before the engine is first created."""
+    if not app.config.get('COOPERATIVE_DB') or socketio.async_mode != 'eventlet':
+        return
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    backend = url.get_backend_name()
+    if backend == 'postgresql':
+        import psycopg2.extensions
+        psycopg2.extensions.set_wait_callback(eventlet_wait_callback)
+    elif backend == 'sqlite' and url.database not in (None, '', ':memory:'):
+        options = dict(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        options['creator'] = functools.partial(_tpool_sqlite_connect, url.database)
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def eventlet_wait_callback(conn, timeout=-1):
+    """psycopg2 wait callback: poll the connection, parking on the hub until its socket is ready."""
+    import psycopg2.extensions
+    from eventlet.hubs import trampoline
+
+    while True:
+        state = conn.poll()
+        if state == psycopg2.extensions.POLL_OK:
+            return
+        if state == psycopg2.extensions.POLL_READ:
+            trampoline(conn.fileno(), read=True)
+        elif state == psycopg2.extensions.POLL_WRITE:
+            trampoline(conn.fileno(), write=True)
+        else:
+            raise psycopg2.OperationalError(f'Bad result from poll: {state}')
+
+
+def _tpool_sqlite_connect(database):
+    from eventlet import tpool
+
+    # The proxy runs each call on whichever pool thread is free, so the thread check is off
+    connection = tpool.execute(sqlite3.connect, database, check_same_thread=False)
+    return tpool.Proxy(connection, autowrap=(sqlite3.Cursor,))
+
+
+def unwrap(dbapi_connection):
+    """The driver connection behind a tpool proxy, for setting attributes on it."""
+    return getattr(dbapi_connection, '_obj', dbapi_connection)
@@ -0,0 +1,153 @@
+# app/dashboard_cache.py
+"""Redis cache for the admin dashboard aggregates.
+
+The aggregates hash holds the revenue and transaction totals plus one
+`month:YYYY-MM` revenue bucket per month; the low-stock hash maps product id
+to a JSON {name, stock}. Both are filled from SQL on a miss and then kept
+current incrementally from the checkout and stock write paths. Increments
+only apply while the cache is warm, so a partial hash is never read back.
+"""
+import json
+from flask import current_app
+from redis import RedisError
+from sqlalchemy import func
+from app.models import db, Product, SalesHourly
+
+AGGREGATES_KEY = 'dashboard:aggregates'
+LOW_STOCK_KEY = 'dashboard:low_stock'
+LOW_STOCK_THRESHOLD = 10
+CACHE_TTL = 3600  # Upper bound on staleness if an increment is ever lost
+
+_RECORD_SALE = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+redis.call('HINCRBYFLOAT', KEYS[1], 'revenue', ARGV[1])
+redis.call('HINCRBY', KEYS[1], 'transactions', 1)
+redis.call('HINCRBYFLOAT', KEYS[1], 'month:' .. ARGV[2], ARGV[1])
+return 1
+"""
+
+# ARGV holds (id, json-or-empty) pairs; an empty value means "not low on stock"
+_STOCK_CHANGED = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end
+for i = 1, #ARGV, 2 do
+    if ARGV[i + 1] == '' then
+        redis.call('HDEL', KEYS[2], ARGV[i])
+    else
+        redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+    end
+end
+return 1
+"""
+
+
+def _redis():
+    return current_app.extensions.get('redis')
+
+
+def _invalidate(client):
+    try:
+        client.delete(AGGREGATES_KEY, LOW_STOCK_KEY)
+    except RedisError:
+        current_app.logger.error('Could not invalidate the dashboard cache')
+
+
+def record_sale(sale_date, total, stock_levels):
+    """Fold a committed sale into the cache; call after the checkout commit."""
+    record_sales([(sale_date, total)], stock_levels)
+
+
+def record_sales(sales, stock_levels):
+    """Fold committed (sale_date, total) pairs and their final stock levels in one pipeline."""
+    client = _redis()
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for sale_date, total in sales:
+            pipe.eval(_RECORD_SALE, 1, AGGREGATES_KEY, total, sale_date.strftime('%Y-%m'))
+        pipe.eval(_STOCK_CHANGED, 2, AGGREGATES_KEY, LOW_STOCK_KEY, *_low_stock_args(stock_levels))
+        pipe.execute()
+    except RedisError:
+        _invalidate(client)
+
+
+def stock_changed(stock_levels):
+    """Refresh low-stock entries for products whose name or stock changed."""
+    client = _redis()
+    if client is None or not stock_levels:
+        return
+    try:
+        client.eval(_STOCK_CHANGED, 2, AGGREGATES_KEY, LOW_STOCK_KEY, *_low_stock_args(stock_levels))
+    except RedisError:
+        _invalidate(client)
+
+
+def product_deleted(product_id):
+    """Drop a deleted product from the low-stock list."""
+    client = _redis()
+    if client is None:
+        return
+    try:
+        client.eval(_STOCK_CHANGED, 2, AGGREGATES_KEY, LOW_STOCK_KEY, product_id, '')
+    except RedisError:
+        _invalidate(client)
+
+
+def _low_stock_args(stock_levels):
+    args = []
+    for product in stock_levels:
+        low = product['stock'] <= LOW_STOCK_THRESHOLD
+        args += [product['id'], json.dumps({'name': product['name'], 'stock': product['stock']}) if low else '']
+    return args
+
+
+def _load_from_sql():
+    totals = db.session.query(func.sum(SalesHourly.revenue), func.sum(SalesHourly.sale_count)).one()
+    sales_by_month = db.session.query(
+        func.strftime('%Y-%m', SalesHourly.day).label('month'),
+        func.sum(SalesHourly.revenue).label('total_sales')
+    ).group_by('month').order_by('month').all()
+    low_stock = db.session.query(Product.id, Product.name, Product.stock).filter(
+        Product.stock <= LOW_STOCK_THRESHOLD
+    ).all()
+
+    aggregates = {'revenue': totals[0] or 0, 'transactions': totals[1] or 0}
+    aggregates.update({f'month:{month}': total for month, total in sales_by_month})
+    low_stock_products = {product.id: {'name': product.name, 'stock': product.stock} for product in low_stock}
+    return aggregates, low_stock_products
+
+
+def _fill(client, aggregates, low_stock_products):
+    try:
+        pipe = client.pipeline()
+        pipe.delete(AGGREGATES_KEY, LOW_STOCK_KEY)
+        pipe.hset(AGGREGATES_KEY, mapping=aggregates)
+        if low_stock_products:
+            pipe.hset(LOW_STOCK_KEY, mapping={pid: json.dumps(p) for pid, p in low_stock_products.items()})
+        pipe.expire(AGGREGATES_KEY, CACHE_TTL)
+        pipe.expire(LOW_STOCK_KEY, CACHE_TTL)
+        pipe.execute()
+    except RedisError:
+        current_app.logger.error('Could not fill the dashboard cache')
+
+
+def get_dashboard_data():
+    """Return (aggregates, low_stock_products) in one Redis round trip, or from SQL on a miss."""
+    client = _redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hgetall(AGGREGATES_KEY)
+            pipe.hgetall(LOW_STOCK_KEY)
+            aggregates, low_stock = pipe.execute()
+            if aggregates:
+                aggregates = {field: float(value) for field, value in aggregates.items()}
+                return aggregates, {int(pid): json.loads(p) for pid, p in low_stock.items()}
+        except RedisError:
+            current_app.logger.error('Dashboard cache unavailable, reading from SQL')
+            client = None
+
+    aggregates, low_stock_products = _load_from_sql()
+    if client is not None:
+        _fill(client, aggregates, low_stock_products)
+    return aggregates, low_stock_products
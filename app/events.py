@@ -0,0 +1,24 @@
+# app/events.py
+from flask_login import current_user
+from flask_socketio import join_room, leave_room, rooms
+from app import socketio
+from app.broadcast import category_room
+
+
+@socketio.on('join_category')
+def join_category(data):
+    """Subscribe this terminal to stock updates for the category it is showing."""
+    if not current_user.is_authenticated:
+        return False
+
+    # A terminal shows one category at a time, so drop any previous subscription
+    for room in rooms():
+        if room.startswith('category:'):
+            leave_room(room)
+    join_room(category_room(int(data['category_id'])))
+    return True
+
+
+@socketio.on('leave_category')
+def leave_category(data):
+    leave_room(category_room(int(data['category_id'])))
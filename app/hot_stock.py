@@ -0,0 +1,238 @@
+# app/hot_stock.py
+"""Write-behind stock counters for the few products that take most sales.
+
+Opt-in via HOT_STOCK_PRODUCTS. For those products checkout takes stock from
+a Redis counter with a guarded multi-key DECRBY script instead of updating
+the products row, and writes its cart_items with stock_pending set. The
+pending cart_items are the durable sale log: the flusher subtracts them
+from products.stock and clears the flag in one transaction, so a crash at
+any point leaves them to be applied by the next flush. A lost or missing
+counter is rebuilt as products.stock minus the pending quantities.
+
+Without Redis, checkout decrements a hot product's row directly, so its
+counter (if Redis still holds one) is then too high. Those products are
+marked dirty in this worker. Their counters are dropped as soon as Redis
+answers again, on the next take or flusher tick, and rebuilt from the
+database.
+"""
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from redis import RedisError
+from sqlalchemy import case, func, select, update
+from app.models import db, Product, CartItem
+from app import catalog, catalog_cache
+from app.writer import sqlite_writer
+
+hotstock_cli = AppGroup('hotstock', help='Manage write-behind stock counters for hot products.')
+
+# One hash tag for every counter so the multi-key scripts stay in one cluster slot
+KEY_PREFIX = '{hotstock}:'
+
+# ARGV: quantities in KEYS order. Returns {1, new stock...}, {0, index} when a line is
+# short, or {-1, index} when a counter is missing and has to be loaded first
+_TAKE = """
+for i, key in ipairs(KEYS) do
+    local stock = redis.call('GET', key)
+    if not stock then return {-1, i} end
+    if tonumber(stock) < tonumber(ARGV[i]) then return {0, i} end
+end
+local result = {1}
+for i, key in ipairs(KEYS) do
+    result[i + 1] = redis.call('DECRBY', key, ARGV[i])
+end
+return result
+"""
+
+# Undo a take whose database transaction failed; missing counters are left to be rebuilt
+_GIVE_BACK = """
+for i, key in ipairs(KEYS) do
+    if redis.call('EXISTS', key) == 1 then redis.call('INCRBY', key, ARGV[i]) end
+end
+return 1
+"""
+
+
+class Unavailable(Exception):
+    """Redis could not be reached; checkout falls back to the database for hot lines."""
+
+
+class ShortLine(Exception):
+    def __init__(self, product_id):
+        super().__init__(product_id)
+        self.product_id = product_id
+
+
+def hot_ids():
+    return current_app.config['HOT_STOCK_PRODUCTS']
+
+
+def is_hot(product_id):
+    return product_id in hot_ids()
+
+
+def _key(product_id):
+    return f'{KEY_PREFIX}{product_id}'
+
+
+def _redis():
+    client = current_app.extensions.get('redis')
+    if client is None:
+        raise Unavailable()
+    return client
+
+
+def available(product_ids):
+    """{product_id: products.stock minus the not-yet-flushed sales}, read in the caller's transaction."""
+    # One statement, so a flush landing mid-read cannot be counted as both applied and pending
+    pending = select(func.coalesce(func.sum(CartItem.quantity), 0)).where(
+        CartItem.product_id == Product.id, CartItem.stock_pending.is_(True)
+    ).scalar_subquery()
+    return dict(db.session.query(Product.id, Product.stock - pending).filter(
+        Product.id.in_(list(product_ids))).all())
+
+
+def load_counters(product_ids):
+    """Set missing counters to products.stock minus the not-yet-flushed sales."""
+    pipe = _redis().pipeline(transaction=False)
+    for product_id, stock in available(product_ids).items():
+        pipe.set(_key(product_id), stock, nx=True)
+    pipe.execute()
+
+
+def _dirty():
+    return current_app.extensions.setdefault('hot_stock_dirty', set())
+
+
+def mark_dirty(product_ids):
+    """Record hot products whose rows a checkout decremented directly; call after the commit."""
+    _dirty().update(product_id for product_id in product_ids if is_hot(product_id))
+
+
+def drop_dirty():
+    """Drop the counters of dirty products, if Redis is back, so they are rebuilt from the database."""
+    dirty = _dirty()
+    if not dirty:
+        return
+    product_ids = list(dirty)
+    try:
+        _redis().delete(*[_key(product_id) for product_id in product_ids])
+    except (RedisError, Unavailable):
+        return
+    dirty.difference_update(product_ids)
+
+
+def take(lines):
+    """Atomically take every hot line's quantity. Returns {product_id: stock left}.
+
+    Raises ShortLine if any line is short (nothing is taken), Unavailable without Redis.
+    """
+    product_ids = list(lines)
+    keys = [_key(product_id) for product_id in product_ids]
+    quantities = [lines[product_id] for product_id in product_ids]
+    drop_dirty()
+    try:
+        result = _redis().eval(_TAKE, len(keys), *keys, *quantities)
+        if result[0] == -1:
+            load_counters(product_ids)
+            result = _redis().eval(_TAKE, len(keys), *keys, *quantities)
+    except RedisError:
+        raise Unavailable()
+
+    if result[0] != 1:
+        raise ShortLine(product_ids[result[1] - 1])
+    return dict(zip(product_ids, result[1:]))
+
+
+def give_back(lines):
+    try:
+        keys = [_key(product_id) for product_id in lines]
+        _redis().eval(_GIVE_BACK, len(keys), *keys, *lines.values())
+    except (RedisError, Unavailable):
+        current_app.logger.error('Could not return stock to hot counters; run `flask hotstock reconcile`')
+
+
+def invalidate(product_ids):
+    """Drop counters after a direct stock write so they are rebuilt from the database."""
+    try:
+        _redis().delete(*[_key(product_id) for product_id in product_ids])
+    except (RedisError, Unavailable):
+        current_app.logger.error('Could not invalidate hot counters; run `flask hotstock reconcile`')
+
+
+def flush():
+    """Apply pending hot sales to products.stock in one transaction. Returns the rows applied."""
+    pending = db.session.query(CartItem.id, CartItem.product_id, CartItem.quantity).filter(
+        CartItem.stock_pending.is_(True)
+    ).all()
+    if not pending:
+        db.session.rollback()
+        return 0
+
+    deltas = {}
+    for row in pending:
+        deltas[row.product_id] = deltas.get(row.product_id, 0) + row.quantity
+
+    try:
+        # Claim exactly the rows summed above; a concurrent flusher that got there first
+        # leaves a short rowcount and this flush backs off
+        claimed = db.session.execute(
+            update(CartItem).where(CartItem.id.in_([row.id for row in pending]), CartItem.stock_pending.is_(True))
+            .values(stock_pending=False).execution_options(synchronize_session=False)
+        )
+        if claimed.rowcount != len(pending):
+            db.session.rollback()
+            return 0
+
+        # Never below zero: a sale taken from a stale counter is logged, not left as negative stock
+        stock = dict(db.session.query(Product.id, Product.stock).filter(Product.id.in_(deltas)).all())
+        oversold = {product_id: quantity - stock[product_id] for product_id, quantity in deltas.items()
+                    if product_id in stock and stock[product_id] < quantity}
+        if oversold:
+            current_app.logger.error(f'Hot stock oversold (product id: units), clamped at zero: {oversold}')
+        for product_id, quantity in sorted(deltas.items()):
+            db.session.execute(
+                update(Product).where(Product.id == product_id)
+                .values(stock=case((Product.stock >= quantity, Product.stock - quantity), else_=0),
+                        version_id=Product.version_id + 1)
+                .execution_options(synchronize_session=False)
+            )
+        version = catalog.mark_changed(deltas.keys())
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    sqlite_writer.after_commit(catalog_cache.publish, catalog_cache.PRODUCTS, version)
+    return len(pending)
+
+
+def run_flusher(app, socketio):
+    """Background loop: flush pending hot sales every HOT_STOCK_FLUSH_INTERVAL seconds."""
+    while True:
+        socketio.sleep(app.config['HOT_STOCK_FLUSH_INTERVAL'])
+        with app.app_context():
+            drop_dirty()
+            try:
+                sqlite_writer.run(flush)
+            except Exception:
+                app.logger.exception('Hot stock flush failed; pending sales will be retried')
+            finally:
+                db.session.remove()
+
+
+@hotstock_cli.command('flush')
+def flush_command():
+    """Apply all pending hot-product sales to products.stock now."""
+    click.echo(f'Applied {flush()} pending sale lines.')
+
+
+@hotstock_cli.command('reconcile')
+def reconcile_command():
+    """Rebuild every hot counter from products.stock and the pending sale log."""
+    product_ids = hot_ids()
+    if not product_ids:
+        click.echo('No hot products configured.')
+        return
+    _redis().delete(*[_key(product_id) for product_id in product_ids])
+    load_counters(product_ids)
+    click.echo(f'Rebuilt {len(product_ids)} hot stock counters.')
@@ -0,0 +1,18 @@
+# app/http_cache.py
+from flask import request, jsonify, make_response
+
+
+def json_with_etag(etag, build):
+    """Answer 304 if the client already holds `etag`, else jsonify(build()) tagged with it.
+
+    `build` is only called on a miss, so a current client costs just the
+    version lookup that produced the ETag.
+    """
+    # Only safe methods may be answered with 304
+    if request.method in ('GET', 'HEAD') and request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'  # Always revalidate, never serve stale
+    return response
@@ -0,0 +1,48 @@
+# app/idempotency.py
+"""Client-generated Idempotency-Key handling for checkout.
+
+A key maps to the sale it created. Redis holds the mapping for
+IDEMPOTENCY_KEY_TTL seconds so a retry is a single GET; the unique
+sales.idempotency_key column is the durable record and the tie-breaker when
+two copies of the same request race each other.
+"""
+from flask import current_app
+from redis import RedisError
+from app.models import db, Sale
+
+MAX_KEY_LENGTH = 64
+
+
+def _key(idempotency_key):
+    return f'idempotency:{idempotency_key}'
+
+
+def valid(idempotency_key):
+    return 0 < len(idempotency_key) <= MAX_KEY_LENGTH
+
+
+def lookup(idempotency_key):
+    """Id of the sale already created with this key, or None."""
+    client = current_app.extensions.get('redis')
+    if client is not None:
+        try:
+            sale_id = client.get(_key(idempotency_key))
+            if sale_id is not None:
+                return int(sale_id)
+        except RedisError:
+            pass
+
+    sale_id = db.session.query(Sale.id).filter(Sale.idempotency_key == idempotency_key).scalar()
+    if sale_id is not None:
+        remember(idempotency_key, sale_id)
+    return sale_id
+
+
+def remember(idempotency_key, sale_id):
+    client = current_app.extensions.get('redis')
+    if client is None:
+        return
+    try:
+        client.set(_key(idempotency_key), sale_id, ex=current_app.config['IDEMPOTENCY_KEY_TTL'])
+    except RedisError:
+        current_app.logger.error('Could not cache idempotency key')
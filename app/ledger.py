@@ -0,0 +1,151 @@
+# app/ledger.py
+"""Append-only stock movement ledger.
+
+Every write that changes a product's stock also inserts StockMovement rows
+in the same transaction. Inserts never update a shared row, so they do not
+contend with each other. Ledger stock is the product's StockSnapshot plus
+every later movement. A background task folds the movement tail into the
+snapshots every LEDGER_COMPACTION_INTERVAL seconds (`flask ledger compact`
+does it on demand), so reading stock levels never sums the whole history.
+`flask ledger verify` checks the ledger against products.stock.
+
+products.stock stays the balance checkout decrements under its oversell
+guard (hot products keep theirs in Redis, see app.hot_stock). The ledger
+is the audited history that balance must agree with.
+"""
+from datetime import datetime, timedelta
+import click
+from flask.cli import AppGroup
+from sqlalchemy import and_, bindparam, func
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Product, CartItem, StockMovement, StockSnapshot, MovementKind
+from app.writer import sqlite_writer
+
+ledger_cli = AppGroup('ledger', help='Compact and verify the stock movement ledger.')
+
+# Movements younger than this are left in the tail, so a transaction that took its id
+# before compaction but commits after it is never skipped
+COMPACTION_LAG = 60
+
+
+def movement(product_id, kind, quantity, sale_id=None, user_id=None, note=None):
+    return {'product_id': product_id, 'kind': kind, 'quantity': quantity,
+            'sale_id': sale_id, 'user_id': user_id, 'note': note}
+
+
+def record(movements):
+    """Append movements with one executemany insert, inside the caller's transaction."""
+    movements = [m for m in movements if m['quantity'] != 0]
+    if movements:
+        db.session.execute(StockMovement.__table__.insert(), movements)
+
+
+def stock_levels(product_ids=None):
+    """Ledger stock per product: snapshot plus the movement tail, in one grouped query."""
+    query = db.session.query(
+        Product.id, func.coalesce(StockSnapshot.stock, 0) + func.coalesce(func.sum(StockMovement.quantity), 0)
+    ).outerjoin(StockSnapshot, StockSnapshot.product_id == Product.id).outerjoin(
+        StockMovement, and_(StockMovement.product_id == Product.id,
+                            StockMovement.id > func.coalesce(StockSnapshot.movement_id, 0))
+    ).group_by(Product.id, StockSnapshot.stock)
+    if product_ids is not None:
+        query = query.filter(Product.id.in_(list(product_ids)))
+    return dict(query.all())
+
+
+def compact(lag=COMPACTION_LAG):
+    """Fold movements older than `lag` seconds into the snapshots. Returns the products folded."""
+    cutoff = datetime.utcnow() - timedelta(seconds=lag)
+    upto = db.session.query(func.max(StockMovement.id)).filter(StockMovement.created_at < cutoff).scalar()
+    if upto is None:
+        return 0
+
+    # Each product's tail with the snapshot it builds on (None when there is none yet)
+    tail = db.session.query(
+        StockMovement.product_id, StockSnapshot.movement_id, func.sum(StockMovement.quantity)
+    ).outerjoin(
+        StockSnapshot, StockSnapshot.product_id == StockMovement.product_id
+    ).filter(
+        StockMovement.id <= upto, StockMovement.id > func.coalesce(StockSnapshot.movement_id, 0)
+    ).group_by(StockMovement.product_id, StockSnapshot.movement_id).all()
+    if not tail:
+        return 0
+
+    now = datetime.utcnow()
+    snapshots = StockSnapshot.__table__
+    updates = [{'pid': pid, 'seen': seen, 'delta': delta} for pid, seen, delta in tail if seen is not None]
+    inserts = [{'product_id': pid, 'stock': delta, 'movement_id': upto, 'taken_at': now}
+               for pid, seen, delta in tail if seen is None]
+    try:
+        # Every worker compacts; a snapshot another one moved since the read above means it folded
+        # this tail first, and this run backs off instead of adding it twice
+        if updates:
+            updated = db.session.execute(
+                snapshots.update().where(snapshots.c.product_id == bindparam('pid'),
+                                         snapshots.c.movement_id == bindparam('seen')).values(
+                    stock=snapshots.c.stock + bindparam('delta'), movement_id=upto, taken_at=now),
+                updates
+            )
+            if updated.rowcount != len(updates):
+                db.session.rollback()
+                return 0
+        if inserts:
+            db.session.execute(snapshots.insert(), inserts)
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # Another worker created the snapshot first
+        return 0
+    except Exception:
+        db.session.rollback()
+        raise
+    return len(tail)
+
+
+def run_compactor(app, socketio):
+    """Background loop: compact the ledger every LEDGER_COMPACTION_INTERVAL seconds."""
+    while True:
+        socketio.sleep(app.config['LEDGER_COMPACTION_INTERVAL'])
+        with app.app_context():
+            try:
+                sqlite_writer.run(compact)
+            except Exception:
+                app.logger.exception('Ledger compaction failed; the tail is folded on the next run')
+            finally:
+                db.session.remove()
+
+
+def drift():
+    """Products whose ledger stock disagrees with products.stock, as {id: (ledger, balance)}.
+
+    Hot-product sales are in the ledger before the flusher applies them to
+    products.stock, so the balance is taken net of pending cart_items.
+    """
+    pending = dict(db.session.query(CartItem.product_id, func.sum(CartItem.quantity)).filter(
+        CartItem.stock_pending.is_(True)).group_by(CartItem.product_id).all())
+    ledger = stock_levels()
+    balances = db.session.query(Product.id, Product.stock).all()
+    return {pid: (ledger.get(pid, 0), stock - (pending.get(pid) or 0))
+            for pid, stock in balances if ledger.get(pid, 0) != stock - (pending.get(pid) or 0)}
+
+
+@ledger_cli.command('compact')
+@click.option('--lag', default=COMPACTION_LAG, show_default=True, help='Leave movements younger than this many seconds.')
+def compact_command(lag):
+    """Fold the movement tail into the stock snapshots."""
+    click.echo(f'Compacted movements for {compact(lag)} products.')
+
+
+@ledger_cli.command('verify')
+@click.option('--fix', is_flag=True, help='Append correction movements so the ledger matches products.stock.')
+def verify_command(fix):
+    """Report products whose ledger stock disagrees with products.stock."""
+    mismatches = drift()
+    for pid, (ledger, balance) in sorted(mismatches.items()):
+        click.echo(f'Product {pid}: ledger {ledger}, products.stock {balance}')
+    if fix and mismatches:
+        record([movement(pid, MovementKind.CORRECTION, balance - ledger, note='ledger verify --fix')
+                for pid, (ledger, balance) in mismatches.items()])
+        db.session.commit()
+        click.echo(f'Recorded {len(mismatches)} corrections.')
+    elif not mismatches:
+        click.echo('Ledger matches products.stock.')
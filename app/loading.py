@@ -0,0 +1,27 @@
+# app/loading.py
+"""Load-option profiles for each view.
+
+Relationships on the models default to plain lazy loading; every view picks
+the profile below that fetches exactly what its template renders. The
+trailing raiseload('*') turns any accidental relationship access into an
+error instead of a silent per-row query.
+"""
+from sqlalchemy.orm import configure_mappers, load_only, raiseload, selectinload, joinedload
+from app.models import Category, Product, Sale, CartItem
+
+# Backrefs such as CartItem.product only exist once the mappers are configured
+configure_mappers()
+
+# Sales screen and category admin: category id and name only, no products
+CATEGORY_LIST = (load_only(Category.id, Category.name), raiseload('*'))
+
+# Products page and POS product grid: scalar product columns only
+PRODUCT_LIST = (load_only(Product.id, Product.name, Product.price, Product.stock, Product.category_id),
+                raiseload('*'))
+
+# Report and dashboard sale headers, without their line items
+SALE_SUMMARY = (load_only(Sale.id, Sale.date, Sale.total, Sale.payment_method, Sale.customer_name),
+                raiseload('*'))
+
+# Sale.serialize(): lines in one extra query, each line's product joined in
+SALE_DETAIL = (selectinload(Sale.cart_items).joinedload(CartItem.product), raiseload('*'))
@@ -13,6 +13,13 @@ class Role(Enum):
     ADMIN = 'admin'
     CASHIER = 'cashier'
 
+# Why a product's stock moved
+class MovementKind(Enum):
+    SALE = 'sale'
+    RECEIPT = 'receipt'
+    ADJUSTMENT = 'adjustment'
+    CORRECTION = 'correction'
+
 # User Model with Role-based Access
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -40,7 +47,7 @@ class Category(db.Model):
     __tablename__ = 'categories'
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
-    products = db.relationship('Product', backref='category', lazy='joined')  # Join on query to reduce additional queries
+    products = db.relationship('Product', backref='category', lazy='select')  # Views choose eager loading via app.loading
 
 # Product Model with Input Validation and Low Stock Alert
 class Product(db.Model):
@@ -50,10 +57,14 @@ class Product(db.Model):
     price = db.Column(db.Float, nullable=False, default=0.0)  # Ensure price defaults to 0.0
     stock = db.Column(db.Integer, nullable=False, default=0)  # Ensure stock defaults to 0
     category_id = db.Column(db.Integer, db.ForeignKey('categories.id'), nullable=False)
-    sale_items = db.relationship('CartItem', backref='product', lazy='joined')  # Use joined loading for optimization
+    catalog_version = db.Column(db.BigInteger, nullable=False, default=0, index=True)  # Set by app.catalog on every write
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')  # Optimistic lock; Core stock UPDATEs bump it too
+    sale_items = db.relationship('CartItem', backref='product', lazy='select')  # Never eager: grows with sales history
 
-    # Add indexes for faster querying by category
-    __table_args__ = (Index('ix_product_category_id', 'category_id'), )
+    # Add indexes for faster querying by category, and for per-category catalog versions
+    __table_args__ = (Index('ix_product_category_id', 'category_id'),
+                      Index('ix_product_category_version', 'category_id', 'catalog_version'))
+    __mapper_args__ = {'version_id_col': version_id}
 
     @validates('price', 'stock')
     def validate_price_stock(self, key, value):
@@ -76,7 +87,8 @@ class Sale(db.Model):
     total = db.Column(db.Float, nullable=False)
     payment_method = db.Column(db.String(50), nullable=False)  # 'cash', 'mpesa', 'credit'
     customer_name = db.Column(db.String(200), nullable=True)  # Optional
-    cart_items = db.relationship('CartItem', backref='sale', lazy='joined')  # Use joined loading for optimization
+    idempotency_key = db.Column(db.String(64), unique=True, nullable=True)  # Client key that makes checkout retries safe
+    cart_items = db.relationship('CartItem', backref='sale', lazy='select')  # Views choose eager loading via app.loading
 
     def serialize(self):
         """Convert the Sale object to a dictionary format for JSON serialization."""
@@ -106,19 +118,75 @@ class CartItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
     quantity = db.Column(db.Integer, nullable=False)
+    unit_price = db.Column(db.Float, nullable=False)  # Price snapshot taken at checkout
     sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=False)
+    # Hot-product line whose quantity has not yet been flushed to products.stock
+    stock_pending = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false(), index=True)
 
     def __repr__(self):
         return f'<CartItem product_id={self.product_id}, quantity={self.quantity}>'
 
     def serialize(self):
         """Convert the CartItem object to a dictionary format for JSON serialization."""
-        product = self.product
         return {
-            'product_name': product.name,
+            'product_name': self.product.name,
             'quantity': self.quantity,
-            'total_price': self.quantity * product.price
+            'unit_price': self.unit_price,
+            'total_price': self.quantity * self.unit_price
         }
 
 # Add necessary indexes for performance improvements
 Index('ix_sale_date', Sale.date)
+
+# Pre-aggregated sales rollups, maintained inside the checkout transaction
+class SalesDailyProduct(db.Model):
+    __tablename__ = 'sales_daily_product'
+    day = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+class SalesHourly(db.Model):
+    __tablename__ = 'sales_hourly'
+    day = db.Column(db.Date, primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)  # 0-23, in the same clock as Sale.date
+    sale_count = db.Column(db.Integer, nullable=False, default=0)
+    items_sold = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+# Catalog versioning for delta sync and ETags: one counter row per kind of write (see app/catalog.py)
+class CatalogState(db.Model):
+    __tablename__ = 'catalog_state'
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class CatalogTombstone(db.Model):
+    __tablename__ = 'catalog_tombstones'
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)
+    category_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.BigInteger, nullable=False, index=True)
+
+    __table_args__ = (Index('ix_tombstone_category_version', 'category_id', 'version'), )
+
+# Insert-only stock ledger: every change to a product's stock appends a signed movement
+class StockMovement(db.Model):
+    __tablename__ = 'stock_movements'
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, nullable=False)  # No foreign key: the trail outlives deleted products
+    kind = db.Column(db.Enum(MovementKind), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)  # Signed: sales are negative, receipts positive
+    sale_id = db.Column(db.Integer, db.ForeignKey('sales.id'), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    note = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (Index('ix_stock_movement_product', 'product_id', 'id'), )
+
+# Ledger stock folded up to movement_id; current stock is this plus the later movements
+class StockSnapshot(db.Model):
+    __tablename__ = 'stock_snapshots'
+    product_id = db.Column(db.Integer, primary_key=True)
+    stock = db.Column(db.Integer, nullable=False, default=0)
+    movement_id = db.Column(db.Integer, nullable=False, default=0)
+    taken_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -0,0 +1,182 @@
+# app/pipeline.py
+"""Optional group-commit pipeline for checkout.
+
+With CHECKOUT_PIPELINE set, /sales/checkout validates and reserves as usual
+and then hands the sale to a committer task instead of committing it
+itself. The committer drains up to CHECKOUT_GROUP_SIZE queued sales and
+records them with place_sales() in one transaction, so concurrent tills
+share one commit. A request is answered only after the transaction holding its sale
+has committed, so durability is unchanged.
+
+'local' queues in-process (one worker). 'redis' queues on a Redis stream
+read by a consumer group: any worker's committer can take a sale, replies
+travel back through short-lived Redis keys, and a sale left pending by a
+dead committer is claimed again after CHECKOUT_PIPELINE_TIMEOUT seconds;
+its idempotency key turns a re-run of an already committed sale into a replay.
+"""
+import json
+import os
+import socket
+from uuid import uuid4
+from flask import current_app
+from redis import RedisError, ResponseError
+from app import socketio
+from app.models import db
+from app.checkout import CheckoutError, StockConflict, place_sales
+from app.broadcast import stock_broadcaster
+
+STREAM_KEY = 'checkout:stream'
+GROUP = 'committers'
+REPLY_TTL = 60
+POLL_INTERVAL = 0.01  # Seconds between checks; non-blocking so an unpatched eventlet hub never stalls
+
+
+class PipelineTimeout(CheckoutError):
+    status_code = 504
+
+
+class CheckoutPipeline:
+    def __init__(self, socketio):
+        self.socketio = socketio
+        self.mode = None
+
+    def init_app(self, app):
+        self.mode = app.config.get('CHECKOUT_PIPELINE') or None
+        if self.mode is None:
+            return
+        if self.mode not in ('local', 'redis'):
+            raise ValueError(f'Unknown CHECKOUT_PIPELINE mode: {self.mode}')
+        self.group_size = app.config['CHECKOUT_GROUP_SIZE']
+        self.timeout = app.config['CHECKOUT_PIPELINE_TIMEOUT']
+        if self.mode == 'local':
+            # engineio's primitives match the Socket.IO async mode (eventlet, gevent or threads)
+            primitives = self.socketio.server.eio._async
+            self._queue = primitives['queue']()
+            self._queue_empty = primitives['queue_empty']
+            self._event = primitives['event']
+        self.socketio.start_background_task(self._run, app)
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    def submit(self, entry):
+        """Queue one place_sales() entry and wait for its result dict."""
+        if self.mode == 'local':
+            slot = {'entry': entry, 'done': self._event(), 'result': None}
+            self._queue.put(slot)
+            if not slot['done'].wait(self.timeout):
+                raise PipelineTimeout('Sale is still being recorded; retry with the same Idempotency-Key')
+            return slot['result']
+
+        client = current_app.extensions.get('redis')
+        reply_id = uuid4().hex
+        reply_key = f'checkout:reply:{reply_id}'
+        try:
+            client.xadd(STREAM_KEY, {'entry': json.dumps(entry), 'reply': reply_id}, maxlen=10000, approximate=True)
+            waited = 0
+            while waited < self.timeout:
+                reply = client.get(reply_key)
+                if reply is not None:
+                    client.delete(reply_key)
+                    return json.loads(reply)
+                self.socketio.sleep(POLL_INTERVAL)
+                waited += POLL_INTERVAL
+        except (RedisError, AttributeError):
+            raise CheckoutError('Checkout queue unavailable')
+        raise PipelineTimeout('Sale is still being recorded; retry with the same Idempotency-Key')
+
+    def _run(self, app):
+        run = self._run_local if self.mode == 'local' else self._run_redis
+        while True:
+            try:
+                run(app)
+            except Exception:
+                app.logger.exception('Checkout committer failed; restarting')
+                self.socketio.sleep(1)
+
+    def _run_local(self, app):
+        while True:
+            slots = [self._queue.get()]
+            # Everything that queued up during the previous commit goes into this one
+            while len(slots) < self.group_size:
+                try:
+                    slots.append(self._queue.get_nowait())
+                except self._queue_empty:
+                    break
+            results = commit_group(app, [slot['entry'] for slot in slots])
+            for slot, result in zip(slots, results):
+                slot['result'] = result
+                slot['done'].set()
+
+    def _run_redis(self, app):
+        client = app.extensions['redis']
+        consumer = f'{socket.gethostname()}-{os.getpid()}'
+        try:
+            client.xgroup_create(STREAM_KEY, GROUP, id='0', mkstream=True)
+        except ResponseError:
+            pass  # BUSYGROUP: another worker created it
+
+        idle_ms = int(self.timeout * 1000)
+        while True:
+            # Sales a dead committer took but never acknowledged come back after the timeout
+            _, claimed, *_ = client.xautoclaim(STREAM_KEY, GROUP, consumer, idle_ms, count=self.group_size)
+            messages = [message for message in claimed if message and message[1]]
+            if not messages:
+                response = client.xreadgroup(GROUP, consumer, {STREAM_KEY: '>'}, count=self.group_size)
+                messages = response[0][1] if response else []
+            if not messages:
+                self.socketio.sleep(POLL_INTERVAL)
+                continue
+
+            entries = [json.loads(fields['entry']) for _, fields in messages]
+            results = commit_group(app, entries)
+            pipe = client.pipeline(transaction=False)
+            for (_, fields), result in zip(messages, results):
+                pipe.set(f"checkout:reply:{fields['reply']}", json.dumps(result), ex=REPLY_TTL)
+            pipe.xack(STREAM_KEY, GROUP, *[message_id for message_id, _ in messages])
+            pipe.xdel(STREAM_KEY, *[message_id for message_id, _ in messages])
+            pipe.execute()
+
+
+def commit_group(app, entries):
+    """Record a group of sales in one transaction; returns one result dict per entry.
+
+    A StockConflict fails the whole transaction, so the group is then retried
+    one sale at a time and only the sale that really conflicts is refused. A
+    sale that fails for any other reason on its own gets a status 500 result,
+    so every waiter is answered.
+    Successful results carry the post-sale 'stock_levels' of their products.
+    """
+    with app.app_context():
+        try:
+            results, stock_levels = place_sales(entries)
+        except StockConflict:
+            results, stock_levels = [], []
+            for entry in entries:
+                try:
+                    result, levels = place_sales([entry])
+                except CheckoutError as e:
+                    result, levels = [{'success': False, 'message': str(e), 'status': e.status_code}], []
+                except Exception as e:
+                    app.logger.exception('Checkout failed on retry')
+                    result, levels = [{'success': False, 'message': str(e), 'status': 500}], []
+                results += result
+                stock_levels += levels
+        except Exception as e:
+            app.logger.exception('Checkout group failed')
+            results = [{'success': False, 'message': str(e), 'status': 500} for _ in entries]
+            stock_levels = []
+        finally:
+            db.session.remove()
+
+    stock_broadcaster.queue(stock_levels)
+    by_id = {level['id']: level for level in stock_levels}
+    for entry, result in zip(entries, results):
+        if result['success']:
+            product_ids = {int(item['id']) for item in entry['cart']}
+            result['stock_levels'] = [by_id[pid] for pid in product_ids if pid in by_id]
+    return results
+
+
+checkout_pipeline = CheckoutPipeline(socketio)
@@ -0,0 +1,179 @@
+# app/reservations.py
+"""Per-terminal stock reservations held in Redis between add-to-cart and checkout.
+
+For each product, Redis keeps:
+  stock:{id}                 mirror of products.stock, refreshed after every committed write
+  reservations:{id}          zset of terminal -> reservation expiry (epoch seconds)
+  reservations:{id}:qty      hash of terminal -> reserved quantity
+
+All reads and writes of a product's reservations go through Lua scripts, so
+checking availability and taking a reservation is a single atomic step.
+Expired reservations are purged lazily by whichever script touches the
+product next. The `{id}` hash tag keeps one product's keys in one cluster slot.
+"""
+import time
+from flask import current_app, session
+from redis import RedisError
+from uuid import uuid4
+from app.models import db, Product
+
+# Shared prologue: drop expired reservations and total up the live ones.
+# KEYS: stock, reservations zset, reservations qty hash. ARGV[1]: terminal, ARGV[2]: now
+_LIVE_RESERVATIONS = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+for _, terminal in ipairs(expired) do redis.call('HDEL', KEYS[3], terminal) end
+redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', ARGV[2])
+local stock = redis.call('GET', KEYS[1])
+if not stock then return {-1, 0} end
+local mine = tonumber(redis.call('HGET', KEYS[3], ARGV[1]) or '0')
+local others = -mine
+local held = redis.call('HVALS', KEYS[3])
+for _, qty in ipairs(held) do others = others + tonumber(qty) end
+local available = tonumber(stock) - others
+"""
+
+# ARGV[3]: quantity, ARGV[4]: ttl, ARGV[5]: 'add' to reserve more, 'cover' to hold at least ARGV[3]
+# Returns {status, units still available to this terminal}; status -1 means the stock mirror is cold
+_RESERVE = _LIVE_RESERVATIONS + """
+local quantity = tonumber(ARGV[3])
+local target = quantity
+if ARGV[5] == 'add' then target = mine + quantity end
+if target < mine then target = mine end
+if target > available then return {0, available - mine} end
+redis.call('HSET', KEYS[3], ARGV[1], target)
+redis.call('ZADD', KEYS[2], tonumber(ARGV[2]) + tonumber(ARGV[4]), ARGV[1])
+redis.call('EXPIRE', KEYS[2], ARGV[4])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+return {1, available - target}
+"""
+
+# Units available to this terminal: stock minus everyone else's live reservations
+_AVAILABLE = _LIVE_RESERVATIONS + """
+return {1, available}
+"""
+
+# ARGV[1]: terminal, ARGV[2]: quantity to release, or 0 to release the whole reservation
+_RELEASE = """
+local mine = tonumber(redis.call('HGET', KEYS[3], ARGV[1]) or '0')
+local remaining = mine - tonumber(ARGV[2])
+if tonumber(ARGV[2]) <= 0 or remaining <= 0 then
+    redis.call('HDEL', KEYS[3], ARGV[1])
+    redis.call('ZREM', KEYS[2], ARGV[1])
+else
+    redis.call('HSET', KEYS[3], ARGV[1], remaining)
+end
+return 1
+"""
+
+
+class ReservationUnavailable(Exception):
+    """Redis could not be reached; callers fall back to the database stock check."""
+
+
+def terminal_id():
+    """Stable id for this POS session."""
+    if 'terminal_id' not in session:
+        session['terminal_id'] = uuid4().hex
+    return session['terminal_id']
+
+
+def _keys(product_id):
+    return [f'stock:{{{product_id}}}', f'reservations:{{{product_id}}}', f'reservations:{{{product_id}}}:qty']
+
+
+def _redis():
+    client = current_app.extensions.get('redis')
+    if client is None:
+        raise ReservationUnavailable()
+    return client
+
+
+def _run(script, product_id, *args):
+    """Run a reservation script, warming the stock mirror from the database once if it is cold."""
+    client = _redis()
+    keys = _keys(product_id)
+    argv = [terminal_id(), time.time(), *args]
+    try:
+        status, value = client.eval(script, 3, *keys, *argv)
+        if status == -1:
+            stock = db.session.query(Product.stock).filter(Product.id == product_id).scalar()
+            if stock is None:
+                return 0, 0
+            client.set(keys[0], stock, ex=current_app.config['STOCK_MIRROR_TTL'], nx=True)
+            status, value = client.eval(script, 3, *keys, *argv)
+    except RedisError:
+        raise ReservationUnavailable()
+    return status, value
+
+
+def reserve(product_id, quantity):
+    """Reserve `quantity` more units for this terminal. Returns (ok, units still available)."""
+    status, available = _run(_RESERVE, product_id, quantity, current_app.config['RESERVATION_TTL'], 'add')
+    return status == 1, available
+
+
+def cover(lines):
+    """Make sure this terminal holds at least the cart quantity of every line before checkout.
+
+    Returns the id of the first product that other terminals have reserved away, or None.
+    """
+    for product_id, quantity in lines.items():
+        status, _ = _run(_RESERVE, product_id, quantity, current_app.config['RESERVATION_TTL'], 'cover')
+        if status != 1:
+            return product_id
+    return None
+
+
+def release(product_id, quantity=0):
+    """Give back `quantity` reserved units, or the whole reservation when quantity is 0."""
+    try:
+        _redis().eval(_RELEASE, 3, *_keys(product_id), terminal_id(), quantity)
+    except RedisError:
+        raise ReservationUnavailable()
+
+
+def available(product_ids):
+    """Units each product has available for this terminal, in one pipelined Redis round trip."""
+    product_ids = list(product_ids)
+    argv = [terminal_id(), time.time()]
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for product_id in product_ids:
+            pipe.eval(_AVAILABLE, 3, *_keys(product_id), *argv)
+        results = pipe.execute()
+    except RedisError:
+        raise ReservationUnavailable()
+
+    availability = {}
+    for product_id, (status, value) in zip(product_ids, results):
+        # Cold mirrors are warmed one by one; steady state never reaches the database
+        availability[product_id] = value if status == 1 else _run(_AVAILABLE, product_id)[1]
+    return availability
+
+
+def sync_stock(stock_levels):
+    """Refresh the stock mirror after a committed write."""
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for level in stock_levels:
+            key = _keys(level['id'])[0]
+            if level.get('deleted'):
+                pipe.delete(key)
+            else:
+                pipe.set(key, level['stock'], ex=current_app.config['STOCK_MIRROR_TTL'])
+        pipe.execute()
+    except (RedisError, ReservationUnavailable):
+        current_app.logger.error('Could not refresh the reservation stock mirror')
+
+
+def convert(stock_levels):
+    """After a committed checkout: the sold units leave stock, so drop this terminal's holds on them."""
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        for level in stock_levels:
+            keys = _keys(level['id'])
+            pipe.set(keys[0], level['stock'], ex=current_app.config['STOCK_MIRROR_TTL'])
+            pipe.eval(_RELEASE, 3, *keys, terminal_id(), 0)
+        pipe.execute()
+    except (RedisError, ReservationUnavailable):
+        current_app.logger.error('Could not release converted reservations')
@@ -0,0 +1,110 @@
+# app/rollups.py
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, extract, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import db, Sale, CartItem, SalesDailyProduct, SalesHourly
+
+rollups_cli = AppGroup('rollups', help='Maintain the pre-aggregated sales rollup tables.')
+
+daily_table = SalesDailyProduct.__table__
+hourly_table = SalesHourly.__table__
+
+
+def _upsert(table, rows, keys, counters):
+    """Insert rows, adding the counter columns onto any row that already exists."""
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        dialect_insert = sqlite.insert if dialect == 'sqlite' else postgresql.insert
+        stmt = dialect_insert(table).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={col: table.c[col] + stmt.excluded[col] for col in counters}
+        )
+        db.session.execute(stmt)
+        return
+
+    # Generic fallback: bump existing rows, insert the ones that were missing
+    for row in rows:
+        match = [table.c[key] == row[key] for key in keys]
+        result = db.session.execute(
+            table.update().where(*match).values({col: table.c[col] + row[col] for col in counters})
+        )
+        if result.rowcount == 0:
+            db.session.execute(table.insert().values(row))
+
+
+def record_sale(sale_date, lines, products):
+    """Fold one sale into the rollups; runs inside the caller's checkout transaction.
+
+    `lines` maps product_id -> quantity and `products` maps product_id -> Product.
+    """
+    record_sales([(sale_date, lines)], products)
+
+
+def record_sales(sales, products):
+    """Fold many (sale_date, lines) pairs into the rollups with one upsert per table."""
+    daily, hourly = {}, {}
+    for sale_date, lines in sales:
+        day = sale_date.date()
+        revenue = 0
+        for pid, quantity in lines.items():
+            line_revenue = products[pid].price * quantity
+            row = daily.setdefault((day, pid), {'day': day, 'product_id': pid, 'quantity': 0, 'revenue': 0})
+            row['quantity'] += quantity
+            row['revenue'] += line_revenue
+            revenue += line_revenue
+
+        row = hourly.setdefault((day, sale_date.hour), {
+            'day': day, 'hour': sale_date.hour, 'sale_count': 0, 'items_sold': 0, 'revenue': 0})
+        row['sale_count'] += 1
+        row['items_sold'] += sum(lines.values())
+        row['revenue'] += revenue
+
+    if daily:
+        _upsert(daily_table, list(daily.values()), ['day', 'product_id'], ['quantity', 'revenue'])
+        _upsert(hourly_table, list(hourly.values()), ['day', 'hour'], ['sale_count', 'items_sold', 'revenue'])
+
+
+def rebuild():
+    """Recompute both rollup tables from the raw sales history."""
+    sale_day = func.date(Sale.date)
+    sale_hour = extract('hour', Sale.date)
+
+    db.session.execute(daily_table.delete())
+    db.session.execute(hourly_table.delete())
+
+    daily_select = (
+        select(sale_day, CartItem.product_id, func.sum(CartItem.quantity),
+               func.sum(CartItem.quantity * CartItem.unit_price))
+        .select_from(CartItem)
+        .join(Sale, CartItem.sale_id == Sale.id)
+        .group_by(sale_day, CartItem.product_id)
+    )
+    db.session.execute(insert(daily_table).from_select(
+        ['day', 'product_id', 'quantity', 'revenue'], daily_select))
+
+    # Item counts per sale are summed first so a sale is not counted once per line
+    items_per_sale = (
+        select(CartItem.sale_id, func.sum(CartItem.quantity).label('items_sold'))
+        .group_by(CartItem.sale_id)
+        .subquery()
+    )
+    hourly_select = (
+        select(sale_day, sale_hour, func.count(Sale.id),
+               func.coalesce(func.sum(items_per_sale.c.items_sold), 0), func.sum(Sale.total))
+        .select_from(Sale)
+        .outerjoin(items_per_sale, items_per_sale.c.sale_id == Sale.id)
+        .group_by(sale_day, sale_hour)
+    )
+    db.session.execute(insert(hourly_table).from_select(
+        ['day', 'hour', 'sale_count', 'items_sold', 'revenue'], hourly_select))
+
+    db.session.commit()
+
+
+@rollups_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild sales_daily_product and sales_hourly from history."""
+    rebuild()
+    click.echo('Sales rollups rebuilt.')
@@ -1,23 +1,30 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
 from flask_login import login_required, current_user
-from app.models import db, Product, Sale, CartItem, Category
+from app.models import db, Product, Sale, CartItem, SalesDailyProduct
 from app import socketio, limiter
+from app.checkout import place_sale, place_sales, normalize_cart, CheckoutError, MAX_BATCH_SALES
+from app.broadcast import stock_broadcaster
+from app.pipeline import checkout_pipeline
+from app.writer import sqlite_writer
+from app import catalog, catalog_cache, carts, reservations, idempotency, search, typeahead
+from app.http_cache import json_with_etag
+from app.auth import session_login_required
+from app.loading import SALE_SUMMARY
 from flask_socketio import emit
 from datetime import datetime, timedelta
+from uuid import uuid4
+from sqlalchemy import func
 from sqlalchemy.exc import IntegrityError
 
 sales_bp = Blueprint('sales', __name__)
 
-# Helper function to check low stock
-def check_low_stock(product):
-    return product.stock < 5
-
 # Route for cashier to view sales screen
 @sales_bp.route('/sales')
 @limiter.limit("200 per day")
 @login_required
 def sales_screen():
-    categories = Category.query.all()
+    carts.issue_id()  # Issued with the page, before any tap can race for it
+    categories = catalog_cache.categories()
     return render_template('sales.html', categories=categories)
 
 # API to fetch products by category
@@ -25,96 +32,301 @@ def sales_screen():
 @limiter.limit("200 per day")
 @login_required
 def get_products_by_category(category_id):
-    products = Product.query.filter_by(category_id=category_id).all()
-    product_list = [{'id': product.id, 'name': product.name, 'price': product.price, 'stock': product.stock} for product in products]
-    return jsonify({'products': product_list})
+    def build():
+        products = catalog_cache.category_products(category_id)
+        product_list = [{'id': product.id, 'name': product.name, 'price': product.price, 'stock': product.stock} for product in products]
+        return {'products': product_list}
+
+    etag = f'category-{category_id}-v{catalog_cache.category_version(category_id)}'
+    return json_with_etag(etag, build)
+
+# API to fetch the category list
+@sales_bp.route('/api/categories', methods=['GET'])
+@limiter.limit("200 per day")
+@login_required
+def get_categories():
+    def build():
+        categories = sorted(catalog_cache.categories(), key=lambda category: category.name)
+        return {'categories': [{'id': category.id, 'name': category.name} for category in categories]}
+
+    etag = f'categories-v{catalog_cache.categories_version()}'
+    return json_with_etag(etag, build)
+
+# API for product name search over the full-text index; results come from the in-memory catalog
+@sales_bp.route('/api/products/search', methods=['GET'])
+@limiter.limit("2000 per day")
+@session_login_required
+def search_products():
+    query = request.args.get('q', '').strip()
+    limit = max(1, min(request.args.get('limit', 20, type=int), 50))
+    if not query:
+        return jsonify({'products': []})
+    product_ids = search.product_ids(query, limit)
+    products = catalog_cache.products(product_ids)
+    return jsonify({'products': [
+        {'id': product.id, 'name': product.name, 'price': product.price, 'stock': product.stock,
+         'category_id': product.category_id}
+        for product in (products[pid] for pid in product_ids if pid in products)
+    ]})
+
+# API for type-ahead: best-selling products with a name word starting with ?q=, from this worker's memory
+@sales_bp.route('/api/products/typeahead', methods=['GET'])
+@limiter.limit("5000 per day")
+@session_login_required
+def typeahead_products():
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), typeahead.TOP_K))
+    return jsonify({'products': [
+        {'id': product.id, 'name': product.name, 'price': product.price, 'stock': product.stock,
+         'category_id': product.category_id}
+        for product in catalog_cache.typeahead(query, limit)
+    ]})
+
+# API for catalog delta sync: rows written and tombstones recorded after ?since=<version>
+@sales_bp.route('/api/catalog/changes', methods=['GET'])
+@limiter.limit("1000 per day")
+@login_required
+def catalog_changes():
+    since = request.args.get('since', 0, type=int)
+    return jsonify(catalog.changes_since(since))
 
-# API to add item to cart (with quantity increment on repeated clicks)
+# API to add item to cart (with quantity increment on repeated clicks); called on every tap, so it
+# reads the in-memory catalog and skips loading the user
 @sales_bp.route('/add_to_cart', methods=['POST'])
 @limiter.limit("500 per day")
-@login_required
+@session_login_required
 def add_to_cart():
     data = request.json
     product_id = data.get('product_id')
-    quantity = data.get('quantity', 1)
+    try:
+        quantity = int(str(data.get('quantity', 1)))  # Through str, so 1.5 or true is rejected, not truncated
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid quantity'}), 400
+    if quantity <= 0:
+        return jsonify({'success': False, 'message': 'Quantity must be positive'}), 400
 
-    product = Product.query.get(product_id)
+    product = catalog_cache.product(int(product_id)) if str(product_id).isdigit() else None
     if not product:
         return jsonify({'success': False, 'message': 'Product not found'}), 404
 
-    if product.stock < quantity:
+    # Hold the units for this till; without Redis, fall back to the plain stock check
+    try:
+        reserved, _ = reservations.reserve(product.id, quantity)
+    except reservations.ReservationUnavailable:
+        reserved = product.stock >= quantity
+    if not reserved:
         return jsonify({'success': False, 'message': 'Insufficient stock'}), 400
 
+    # The line joins this till's server-side cart; without Redis the till sends its lines at checkout
+    try:
+        cart_id = carts.add(product.id, quantity)
+    except carts.CartUnavailable:
+        cart_id = None
+
     return jsonify({
         'success': True,
         'product_id': product.id,
         'product_name': product.name,
         'quantity': quantity,
         'price': product.price,
-        'total_price': product.price * quantity
+        'total_price': product.price * quantity,
+        'cart_id': cart_id
     })
 
+# API to release a cart line's reservation (whole line unless a quantity is given)
+@sales_bp.route('/remove_from_cart', methods=['POST'])
+@limiter.limit("500 per day")
+@login_required
+def remove_from_cart():
+    data = request.json
+    product_id, quantity = int(data['product_id']), int(data.get('quantity', 0))
+    try:
+        reservations.release(product_id, quantity)
+    except reservations.ReservationUnavailable:
+        pass  # Unreleased holds simply expire
+    # A line the server-side cart still holds would be sold; a null cart_id makes the till send its lines
+    try:
+        carts.remove(product_id, quantity)
+        cart_id = carts.current_id()
+    except carts.CartUnavailable:
+        cart_id = None
+    return jsonify({'success': True, 'cart_id': cart_id})
+
+# API for this till's server-side cart, priced from the catalog; restores the cart after a reload
+@sales_bp.route('/cart', methods=['GET'])
+@limiter.limit("1000 per day")
+@session_login_required
+def get_cart():
+    cart_id = carts.issue_id()
+    try:
+        lines = carts.lines(cart_id)
+    except carts.CartUnavailable:
+        return jsonify({'success': False, 'message': 'Cart unavailable'}), 503
+    products = catalog_cache.products(lines)
+    items = [{'id': pid, 'name': products[pid].name, 'price': products[pid].price, 'quantity': quantity,
+              'total_price': products[pid].price * quantity}
+             for pid, quantity in lines.items() if pid in products]
+    return jsonify({'success': True, 'cart_id': cart_id, 'items': items,
+                    'total': sum(item['total_price'] for item in items)})
+
+# API for stock available to this till: stock minus other tills' live reservations
+@sales_bp.route('/api/availability', methods=['GET'])
+@limiter.limit("1000 per day")
+@login_required
+def get_availability():
+    product_ids = [int(pid) for pid in request.args.get('ids', '').split(',') if pid.strip().isdigit()]
+    try:
+        availability = reservations.available(product_ids)
+    except reservations.ReservationUnavailable:
+        rows = db.session.query(Product.id, Product.stock).filter(Product.id.in_(product_ids)).all()
+        availability = dict(rows)
+    return jsonify({'availability': availability})
+
 # API to handle checkout
 @sales_bp.route('/checkout', methods=['POST'])
 @limiter.limit("100 per hour")
 @login_required
+@sqlite_writer.serialize
 def checkout():
     data = request.json
     cart = data.get('cart', [])
     payment_method = data.get('payment_method', 'cash')
     customer_name = data.get('customer_name')
+    # A till with a server-side cart sends only its id; one that had no Redis sends its lines
+    cart_id = data.get('cart_id')
+
+    # A retried request carries the same key; answer it with the sale the first attempt made
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if idempotency_key is not None:
+        if not idempotency.valid(idempotency_key):
+            return jsonify({'success': False, 'message': 'Invalid Idempotency-Key'}), 400
+        sale_id = idempotency.lookup(idempotency_key)
+        if sale_id is not None:
+            close_cart(cart_id)  # The first attempt's response, and the session without the cart, was lost
+            return checkout_response(sale_id, replayed=True)
+
+    if cart_id is not None and not cart:
+        # 404 and 503 both make the till resend its lines
+        if cart_id != carts.current_id():
+            return jsonify({'success': False, 'message': 'Cart not found; it was sold or has expired'}), 404
+        try:
+            cart = [{'id': pid, 'quantity': quantity} for pid, quantity in carts.lines(cart_id).items()]
+        except carts.CartUnavailable:
+            return jsonify({'success': False, 'message': 'Cart unavailable; send the cart lines'}), 503
+        if not cart:
+            return jsonify({'success': False, 'message': 'Cart has expired; send the cart lines'}), 404
 
     if not cart:
         return jsonify({'success': False, 'message': 'Cart is empty'}), 400
 
-    total_amount = 0
-    for item in cart:
-        product = Product.query.get(item['id'])  # Changed from 'product_id' to 'id'
-        if product is None:
-            return jsonify({'success': False, 'message': 'Product not found'}), 404
-        total_amount += product.price * item['quantity']
-
-    sale = Sale(date=datetime.utcnow(), total=total_amount, payment_method=payment_method,
-                customer_name=customer_name if payment_method == 'credit' else None)
-    db.session.add(sale)
-
     try:
-        for item in cart:
-            product = Product.query.get(item['id'])
-            if product.stock < item['quantity']:
-                db.session.rollback()
-                return jsonify({'success': False, 'message': f'Insufficient stock for {product.name}'}), 400
+        # Units other tills hold in their carts are not for sale here
+        try:
+            short_id = reservations.cover(normalize_cart(cart))
+        except reservations.ReservationUnavailable:
+            short_id = None
+        if short_id is not None:
+            return jsonify({'success': False, 'message': 'Insufficient stock: reserved by another till'}), 400
+
+        if checkout_pipeline.enabled:
+            return pipelined_checkout(cart, payment_method, customer_name, idempotency_key, cart_id)
+        sale, stock_levels = place_sale(cart, payment_method, customer_name, idempotency_key)
+    except CheckoutError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status_code
+    except IntegrityError:
+        # A concurrent copy of this request committed first; its sale is the answer
+        sale_id = idempotency.lookup(idempotency_key) if idempotency_key is not None else None
+        if sale_id is not None:
+            try:
+                for product_id in normalize_cart(cart):
+                    reservations.release(product_id)  # Drop the holds this duplicate took
+            except reservations.ReservationUnavailable:
+                pass
+            close_cart(cart_id)
+            return checkout_response(sale_id, replayed=True)
+        return jsonify({'success': False, 'message': 'Integrity error during transaction'}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
 
-            product.stock -= item['quantity']
-            # No commit here yet, we will do it after the loop
+    sale_id = sale.id
 
-            cart_item = CartItem(product_id=product.id, quantity=item['quantity'], sale_id=sale.id)
-            db.session.add(cart_item)
+    @sqlite_writer.after_commit
+    def sold():
+        if idempotency_key is not None:
+            idempotency.remember(idempotency_key, sale_id)
+        # Real-time updates go out in the next coalesced stock batch
+        stock_broadcaster.queue(stock_levels)
+        reservations.convert(stock_levels)
+        close_cart(cart_id)
 
-        db.session.commit()  # Commit all changes at once
+    return checkout_response(sale_id)
 
-        # Emit real-time updates after successful commit
-        for item in cart:
-            product = Product.query.get(item['id'])
-            socketio.emit('stock_updated', {'id': product.id, 'name': product.name, 'stock': product.stock}, broadcast=True)
-            if check_low_stock(product):
-                socketio.emit('low_stock_alert', {'product_name': product.name, 'stock': product.stock}, broadcast=True)
 
-        return jsonify({'success': True, 'message': 'Sale completed successfully'})
-    except IntegrityError:
-        db.session.rollback()
-        return jsonify({'success': False, 'message': 'Integrity error during transaction'}), 400
+# API for tills flushing sales they queued while offline
+@sales_bp.route('/checkout/batch', methods=['POST'])
+@limiter.limit("30 per hour")
+@login_required
+@sqlite_writer.serialize
+def checkout_batch():
+    data = request.get_json(silent=True) or {}
+    entries = data.get('sales')
+    if not isinstance(entries, list) or not entries:
+        return jsonify({'success': False, 'message': 'No sales to record'}), 400
+    if len(entries) > MAX_BATCH_SALES:
+        return jsonify({'success': False, 'message': f'At most {MAX_BATCH_SALES} sales per batch'}), 400
+
+    try:
+        results, stock_levels = place_sales(entries)
+    except CheckoutError as e:
+        return jsonify({'success': False, 'message': str(e)}), e.status_code
     except Exception as e:
-        db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+    sqlite_writer.after_commit(stock_broadcaster.queue, stock_levels)
+    sqlite_writer.after_commit(reservations.sync_stock, stock_levels)
+
+    return jsonify({'success': True, 'results': results})
+
+
+def pipelined_checkout(cart, payment_method, customer_name, idempotency_key, cart_id=None):
+    """Hand the sale to the group-commit pipeline and answer once its transaction has committed."""
+    idempotency_key = idempotency_key or uuid4().hex  # Lets a re-delivered sale replay instead of selling twice
+    result = checkout_pipeline.submit({'cart': cart, 'payment_method': payment_method,
+                                       'customer_name': customer_name, 'idempotency_key': idempotency_key})
+    if not result['success']:
+        return jsonify({'success': False, 'message': result['message']}), result.get('status', 400)
+
+    idempotency.remember(idempotency_key, result['sale_id'])
+    reservations.convert(result.get('stock_levels', []))
+    close_cart(cart_id)
+    return checkout_response(result['sale_id'], replayed=result.get('replayed', False))
+
+
+def close_cart(cart_id):
+    """Drop this till's server-side cart once its sale is recorded."""
+    if cart_id is not None and cart_id == carts.current_id():
+        carts.close(cart_id)
+
+
+def checkout_response(sale_id, replayed=False):
+    """Body of a successful checkout; a replay returns the same body as the original."""
+    response = jsonify({'success': True, 'message': 'Sale completed successfully', 'sale_id': sale_id})
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
 
 @sales_bp.route('/reports/daily', methods=['GET'])
 @limiter.limit("50 per day")
 @login_required
 def daily_sales_report():
     today = datetime.today().date()  # Get today's date
-    sales = Sale.query.filter(db.func.date(Sale.date) == today).all()
+    # Per-product totals for the day come straight from the daily rollup
+    sales = db.session.query(
+        Product.name, SalesDailyProduct.quantity, SalesDailyProduct.revenue
+    ).join(Product, SalesDailyProduct.product_id == Product.id).filter(
+        SalesDailyProduct.day == today
+    ).order_by(SalesDailyProduct.revenue.desc()).all()
 
     if not sales:
         flash("No sales data available for today", "info")
@@ -128,77 +340,66 @@ def daily_sales_report():
 @login_required
 def weekly_sales_report():
     one_week_ago = datetime.utcnow().date() - timedelta(days=7)
-    sales = Sale.query.filter(Sale.date >= one_week_ago).all()
+    sales = Sale.query.options(*SALE_SUMMARY).filter(Sale.date >= one_week_ago).all()
     return render_template('weekly_sales_report.html', sales=sales)
 
 
-@sales_bp.route('/reports/filter', methods=['POST'])
+@sales_bp.route('/reports/filter', methods=['GET', 'POST'])
 @login_required
 def filter_sales_report():
-    start_date_str = request.json.get('start_date')
-    end_date_str = request.json.get('end_date')
+    # GET (query string) supports conditional requests; POST (JSON body) is kept for existing callers
+    params = request.args if request.method == 'GET' else request.json
+    start_date_str = params.get('start_date')
+    end_date_str = params.get('end_date')
 
     # Parse the dates from the request
     start_date = datetime.strptime(start_date_str, '%Y-%m-%d')
     end_date = datetime.strptime(end_date_str, '%Y-%m-%d')
 
-    # Use join to optimize querying sales with items
-    sales = Sale.query.filter(Sale.date.between(start_date, end_date)).all()
-
-    # Initialize report data and totals
-    report_data = {}
-    total_revenue = 0
-    total_items_sold = 0
-    total_profit = 0
-
-    # Process sales data to gather required information
-    for sale in sales:
-        sale_items = sale.cart_items  # Get all items in the sale
-        total_sale_value = sale.total  # Total revenue for this sale
-
-        for item in sale_items:
-            product_name = item.product.name  # Get the product name
-            quantity = item.quantity
-            unit_price = item.product.price  # Cost price of the product
-            cost_price = unit_price * quantity
-            profit = total_sale_value - cost_price
-
-            # Group by product name instead of category
-            if product_name not in report_data:
-                report_data[product_name] = {
-                    'total_sold': 0,
-                    'total_revenue': 0,
-                    'cost_price': 0,
-                    'profit': 0,
-                }
-
-            # Accumulate the values for each product
-            report_data[product_name]['total_sold'] += quantity
-            report_data[product_name]['total_revenue'] += total_sale_value
-            report_data[product_name]['cost_price'] += cost_price
-            report_data[product_name]['profit'] += profit
-
-            # Aggregate totals
-            total_revenue += total_sale_value
-            total_items_sold += quantity
-            total_profit += profit
-
-    # Convert the report data into a list for the JSON response
-    report_data_list = [
-        {
-            'product_name': product,
-            'total_sold': data['total_sold'],
-            'total_revenue': data['total_revenue'],
-            'cost_price': data['cost_price'],
-            'profit': data['profit'],
+    def build():
+        # One grouped query: per-product rows aggregated from the cart_items price
+        # snapshots, with the report totals carried on every row as window sums.
+        # Product names are joined onto the grouped rows, not onto every line.
+        # There is no profit: products carry a selling price only, no cost.
+        quantity = func.sum(CartItem.quantity)
+        revenue = func.sum(CartItem.quantity * CartItem.unit_price)
+        per_product = db.session.query(
+            CartItem.product_id.label('product_id'),
+            quantity.label('total_sold'),
+            revenue.label('total_revenue'),
+            func.sum(quantity).over().label('grand_items_sold'),
+            func.sum(revenue).over().label('grand_revenue'),
+        ).join(
+            Sale, CartItem.sale_id == Sale.id
+        ).filter(
+            Sale.date.between(start_date, end_date)
+        ).group_by(CartItem.product_id).subquery()
+        rows = db.session.query(
+            Product.name.label('product_name'), per_product
+        ).join(Product, Product.id == per_product.c.product_id).all()
+
+        report_data_list = [
+            {
+                'product_name': row.product_name,
+                'total_sold': row.total_sold,
+                'total_revenue': row.total_revenue,
+            }
+            for row in rows
+        ]
+        totals = rows[0] if rows else None
+
+        # Return the sales data and aggregated totals in JSON format
+        return {
+            'sales': report_data_list,
+            'total_revenue': totals.grand_revenue if totals else 0,
+            'total_items_sold': totals.grand_items_sold if totals else 0
         }
-        for product, data in report_data.items()
-    ]
 
-    # Return the sales data and aggregated totals in JSON format
-    return jsonify({
-        'sales': report_data_list,
-        'total_revenue': total_revenue,
-        'total_items_sold': total_items_sold,
-        'total_profit': total_profit
-    })
+    # Sales are append-only, so the newest id and count in the range (plus product
+    # renames) identify the report without computing it
+    last_sale_id, sale_count = db.session.query(func.max(Sale.id), func.count(Sale.id)).filter(
+        Sale.date.between(start_date, end_date)
+    ).one()
+    names_version = catalog.current_version(catalog.NAMES_STATE_ID)
+    etag = f'report-{start_date_str}-{end_date_str}-s{last_sale_id or 0}-{sale_count}-n{names_version}'
+    return json_with_etag(etag, build)
@@ -0,0 +1,112 @@
+# app/search.py
+"""Product name search backed by a real substring index.
+
+SQLite: product_search is an FTS5 table with the trigram tokenizer, one
+row per product (rowid = product id). The stock.py writes that create,
+rename or delete a product update it inside their own transaction.
+Postgres: a pg_trgm GIN index on products.name, which the database keeps
+current by itself, serves ILIKE '%q%'.
+
+The index returns up to CANDIDATES matches unranked. Those are ranked here:
+names that start with the query first, then names with a word that starts
+with it, then shorter names. Asking the index to rank (FTS5 bm25, or
+similarity()) would score every match, thousands of rows for a common word
+like "milk", and would turn a sub-millisecond lookup into tens of
+milliseconds.
+
+Queries shorter than MIN_INDEXED_LENGTH return nothing: neither index can
+serve them, and the scan they would need is the one this module removes.
+
+Both indexes are created by the migration, and by db.create_all() through
+the DDL hooks below. Results are product ids; callers take the rows from the
+catalog cache.
+"""
+import click
+from flask.cli import AppGroup
+from sqlalchemy import DDL, event, text
+from app.models import db, Product
+
+search_cli = AppGroup('search', help='Manage the product name search index.')
+
+TABLE = 'product_search'
+TRIGRAM_INDEX = 'ix_product_name_trgm'
+MIN_INDEXED_LENGTH = 3  # Trigram lookups need three characters
+CANDIDATES = 200  # Matches fetched from the index and ranked in Python
+
+event.listen(Product.__table__, 'after_create', DDL(
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} USING fts5(name, tokenize='trigram')"
+).execute_if(dialect='sqlite'))
+event.listen(Product.__table__, 'after_drop', DDL(f'DROP TABLE IF EXISTS {TABLE}').execute_if(dialect='sqlite'))
+event.listen(Product.__table__, 'after_create', DDL(
+    f'CREATE EXTENSION IF NOT EXISTS pg_trgm; '
+    f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX} ON products USING gin (name gin_trgm_ops)'
+).execute_if(dialect='postgresql'))
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def index(products):
+    """(Re)index created or renamed products within the current transaction."""
+    if _dialect() != 'sqlite' or not products:
+        return
+    rows = [{'id': product.id, 'name': product.name} for product in products]
+    db.session.execute(text(f'DELETE FROM {TABLE} WHERE rowid = :id'), rows)
+    db.session.execute(text(f'INSERT INTO {TABLE} (rowid, name) VALUES (:id, :name)'), rows)
+
+
+def remove(product_ids):
+    if _dialect() != 'sqlite' or not product_ids:
+        return
+    db.session.execute(text(f'DELETE FROM {TABLE} WHERE rowid = :id'), [{'id': pid} for pid in product_ids])
+
+
+def _like_escape(query):
+    return query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _rank(name, query):
+    name = name.lower()
+    if name.startswith(query):
+        return 0, len(name)
+    if f' {query}' in name:
+        return 1, len(name)
+    return 2, len(name)
+
+
+def product_ids(query, limit=20):
+    """Ids of products whose name contains `query` (case-insensitive), best matches first."""
+    if len(query) < MIN_INDEXED_LENGTH:
+        return []
+    dialect = _dialect()
+    if dialect == 'sqlite':
+        # A quoted FTS5 string is a phrase; with trigrams that means "contains"
+        sql = f'SELECT rowid, name FROM {TABLE} WHERE {TABLE} MATCH :q LIMIT :candidates'
+        params = {'q': '"' + query.replace('"', '""') + '"'}
+    elif dialect == 'postgresql':
+        sql = "SELECT id, name FROM products WHERE name ILIKE :pattern ESCAPE '\\' LIMIT :candidates"
+        params = {'pattern': '%' + _like_escape(query) + '%'}
+    else:
+        sql = "SELECT id, name FROM products WHERE lower(name) LIKE lower(:pattern) ESCAPE '\\' LIMIT :candidates"
+        params = {'pattern': '%' + _like_escape(query) + '%'}
+    rows = db.session.execute(text(sql), dict(params, candidates=CANDIDATES)).all()
+    query = query.lower()
+    rows.sort(key=lambda row: _rank(row[1], query))
+    return [row[0] for row in rows[:limit]]
+
+
+def rebuild():
+    """Reindex every product from the products table. Returns the number indexed."""
+    if _dialect() != 'sqlite':
+        return db.session.query(Product.id).count()
+    db.session.execute(text(f'DELETE FROM {TABLE}'))
+    result = db.session.execute(text(f'INSERT INTO {TABLE} (rowid, name) SELECT id, name FROM products'))
+    db.session.commit()
+    return result.rowcount
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the SQLite product search index (Postgres keeps its trigram index itself)."""
+    click.echo(f'Indexed {rebuild()} products.')
@@ -1,7 +1,12 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 from flask_login import login_required, current_user
-from app.models import db, Product, Category
+from app.models import db, Product, Category, MovementKind
 from app import socketio, limiter
+from app.loading import CATEGORY_LIST, PRODUCT_LIST
+from app import dashboard_cache, catalog, catalog_cache, reservations, hot_stock, ledger, search
+from app.broadcast import stock_broadcaster
+from app.concurrency import retry_on_stale
+from app.writer import sqlite_writer
 from flask_socketio import emit
 
 stock_bp = Blueprint('stock', __name__)
@@ -23,12 +28,13 @@ FLASH_INSUFFICIENT_STOCK = 'Insufficient stock for {}.'
 @limiter.limit("100 per hour")
 @login_required
 def categories():
-    categories = Category.query.all()
+    categories = Category.query.options(*CATEGORY_LIST).all()
     return render_template('categories.html', categories=categories)
 
 @stock_bp.route('/categories/new', methods=['GET', 'POST'])
 @limiter.limit("50 per hour")
 @login_required
+@sqlite_writer.serialize
 def new_category():
     if not current_user.is_admin():
         flash(FLASH_ACCESS_DENIED)
@@ -42,7 +48,9 @@ def new_category():
 
         new_category = Category(name=name)
         db.session.add(new_category)
+        version = catalog.bump_version(catalog.CATEGORIES_STATE_ID)
         db.session.commit()
+        sqlite_writer.after_commit(catalog_cache.publish, catalog_cache.CATEGORIES, version)
         flash(FLASH_CATEGORY_CREATED.format(name))
         return redirect(url_for('stock.categories'))
 
@@ -51,12 +59,15 @@ def new_category():
 @stock_bp.route('/categories/<int:id>/edit', methods=['GET', 'POST'])
 @limiter.limit("50 per hour")
 @login_required
+@sqlite_writer.serialize
 def edit_category(id: int):
     category = Category.query.get_or_404(id)
 
     if request.method == 'POST':
         category.name = request.form['name']
+        version = catalog.bump_version(catalog.CATEGORIES_STATE_ID)
         db.session.commit()
+        sqlite_writer.after_commit(catalog_cache.publish, catalog_cache.CATEGORIES, version)
         flash(FLASH_CATEGORY_UPDATED.format(category.name))
         return redirect(url_for('stock.categories'))
 
@@ -65,10 +76,13 @@ def edit_category(id: int):
 @stock_bp.route('/categories/<int:id>/delete', methods=['POST'])
 @limiter.limit("20 per hour")
 @login_required
+@sqlite_writer.serialize
 def delete_category(id: int):
     category = Category.query.get_or_404(id)
     db.session.delete(category)
+    version = catalog.bump_version(catalog.CATEGORIES_STATE_ID)
     db.session.commit()
+    sqlite_writer.after_commit(catalog_cache.publish, catalog_cache.CATEGORIES, version)
     flash(FLASH_CATEGORY_DELETED.format(category.name))
     return redirect(url_for('stock.categories'))
 
@@ -76,18 +90,19 @@ def delete_category(id: int):
 @limiter.limit("100 per hour")
 @login_required
 def products():
-    products = Product.query.all()
+    products = Product.query.options(*PRODUCT_LIST).all()
     return render_template('products.html', products=products)
 
 @stock_bp.route('/products/new', methods=['GET', 'POST'])
 @limiter.limit("50 per hour")
 @login_required
+@sqlite_writer.serialize
 def new_product():
     if not current_user.is_admin():
         flash(FLASH_ACCESS_DENIED)
         return redirect(url_for('stock.products'))
 
-    categories = Category.query.all()
+    categories = Category.query.options(*CATEGORY_LIST).all()
 
     if request.method == 'POST':
         name = request.form['name']
@@ -106,15 +121,28 @@ def new_product():
             category_id=category_id
         )
         db.session.add(new_product)
+        db.session.flush()
+        ledger.record([ledger.movement(new_product.id, MovementKind.RECEIPT, new_product.stock,
+                                       user_id=current_user.id, note='Opening stock')])
+        search.index([new_product])
+        version = catalog.mark_changed([new_product.id])
         db.session.commit()
         flash(FLASH_PRODUCT_ADDED.format(name))
 
-        # Emit real-time stock update
-        socketio.emit('stock_updated', {
+        # Queue real-time stock update
+        stock_level = {
             'id': new_product.id,
             'name': new_product.name,
-            'stock': new_product.stock
-        }, broadcast=True)
+            'stock': new_product.stock,
+            'category_id': new_product.category_id
+        }
+
+        @sqlite_writer.after_commit
+        def published():
+            catalog_cache.publish(catalog_cache.PRODUCTS, version)
+            stock_broadcaster.queue([stock_level])
+            dashboard_cache.stock_changed([stock_level])
+            reservations.sync_stock([stock_level])
 
         return redirect(url_for('stock.products'))
 
@@ -123,53 +151,107 @@ def new_product():
 @stock_bp.route('/products/<int:id>/edit', methods=['GET', 'POST'])
 @limiter.limit("50 per hour")
 @login_required
+@sqlite_writer.serialize
+@retry_on_stale
 def edit_product(id: int):
     if not current_user.is_admin():
         flash(FLASH_ACCESS_DENIED)
         return redirect(url_for('stock.products'))
 
     product = Product.query.get_or_404(id)
-    categories = Category.query.all()
+    categories = Category.query.options(*CATEGORY_LIST).all()
+    # A hot product's row still counts the sales the flusher has not applied; the form shows stock without them
+    pending = product.stock - hot_stock.available([product.id])[product.id] if hot_stock.is_hot(product.id) else 0
 
     if request.method == 'POST':
+        old_category_id = product.category_id
+        old_name = product.name
+        old_stock = product.stock
         product.name = request.form['name']
         product.price = float(request.form['price'])
-        product.stock = int(request.form['stock'])
-        product.category_id = request.form['category']
-
+        # Apply the admin's stock change as a delta, so sales made while the form was open are kept
+        original_stock = request.form.get('original_stock', type=int)
+        form_stock = int(request.form['stock'])
+        stock = form_stock if original_stock is None else old_stock - pending + form_stock - original_stock
+        product.stock = stock + pending  # The flusher takes the pending sales off later
+        product.category_id = int(request.form['category'])
+
+        db.session.flush()
+        ledger.record([ledger.movement(product.id, MovementKind.ADJUSTMENT, product.stock - old_stock,
+                                       user_id=current_user.id, note='Edited product')])
+        if old_category_id == product.category_id:
+            version = catalog.mark_changed([product.id])
+        else:
+            version = catalog.mark_moved(product.id, old_category_id)
+        if old_name != product.name:
+            catalog.bump_version(catalog.NAMES_STATE_ID)
+            search.index([product])
         db.session.commit()
         flash(FLASH_PRODUCT_UPDATED.format(product.name))
 
-        # Emit real-time stock update
-        socketio.emit('stock_updated', {
+        # Queue real-time stock update; a product that moved category leaves the old room's screens
+        stock_level = {
             'id': product.id,
             'name': product.name,
-            'stock': product.stock
-        }, broadcast=True)
+            'stock': stock,
+            'category_id': product.category_id
+        }
+        moved = [] if old_category_id == product.category_id else [
+            dict(stock_level, category_id=old_category_id, deleted=True)
+        ]
+
+        @sqlite_writer.after_commit
+        def published():
+            catalog_cache.publish(catalog_cache.PRODUCTS, version)
+            stock_broadcaster.queue([stock_level] + moved)
+            dashboard_cache.stock_changed([stock_level])
+            reservations.sync_stock([stock_level])
+            if hot_stock.is_hot(stock_level['id']):
+                hot_stock.invalidate([stock_level['id']])
 
         return redirect(url_for('stock.products'))
 
-    return render_template('edit_product.html', product=product, categories=categories)
+    return render_template('edit_product.html', product=product, stock=product.stock - pending,
+                           categories=categories)
 
 @stock_bp.route('/products/<int:id>/delete', methods=['POST'])
 @limiter.limit("20 per hour")
 @login_required
+@sqlite_writer.serialize
 def delete_product(id: int):
     if not current_user.is_admin():
         flash(FLASH_ACCESS_DENIED)
         return redirect(url_for('stock.products'))
 
     product = Product.query.get_or_404(id)
+    # Zero the ledger so a product that later reuses this id starts from nothing
+    ledger_stock = ledger.stock_levels([product.id]).get(product.id, 0)
+    ledger.record([ledger.movement(product.id, MovementKind.ADJUSTMENT, -ledger_stock,
+                                   user_id=current_user.id, note='Product deleted')])
+    version = catalog.mark_deleted(product)
+    catalog.bump_version(catalog.NAMES_STATE_ID)
+    search.remove([product.id])
     db.session.delete(product)
     db.session.commit()
     flash(FLASH_PRODUCT_DELETED.format(product.name))
 
-    # Emit real-time stock update (stock set to 0)
-    socketio.emit('stock_updated', {
+    # Queue real-time stock update (stock set to 0)
+    stock_level = {
         'id': product.id,
         'name': product.name,
-        'stock': 0
-    }, broadcast=True)
+        'stock': 0,
+        'category_id': product.category_id,
+        'deleted': True
+    }
+
+    @sqlite_writer.after_commit
+    def published():
+        catalog_cache.publish(catalog_cache.PRODUCTS, version)
+        stock_broadcaster.queue([stock_level])
+        dashboard_cache.product_deleted(stock_level['id'])
+        reservations.sync_stock([{'id': stock_level['id'], 'deleted': True}])
+        if hot_stock.is_hot(stock_level['id']):
+            hot_stock.invalidate([stock_level['id']])
 
     return redirect(url_for('stock.products'))
 
@@ -177,32 +259,42 @@ def delete_product(id: int):
 @stock_bp.route('/update_stock/<int:product_id>/<int:quantity>', methods=['POST'])
 @login_required
 @limiter.limit("100 per hour")
+@sqlite_writer.serialize
+@retry_on_stale
 def update_stock(product_id: int, quantity: int):
     if not current_user.is_admin() and not current_user.is_cashier():
         flash(FLASH_ACCESS_DENIED)
         return redirect(url_for('stock.products'))
 
     product = Product.query.get_or_404(product_id)
+    # Check against stock net of the pending hot sales; the flusher still applies them to the row
+    stock = hot_stock.available([product.id])[product.id] if hot_stock.is_hot(product.id) else product.stock
     
-    if product.stock < quantity:
+    if stock < quantity:
         flash(FLASH_INSUFFICIENT_STOCK.format(product.name))
         return jsonify(success=False), 400
 
     product.stock -= quantity
+    db.session.flush()
+    ledger.record([ledger.movement(product.id, MovementKind.SALE, -quantity, user_id=current_user.id)])
+    version = catalog.mark_changed([product.id])
     db.session.commit()
 
-    # Emit real-time stock update
-    socketio.emit('stock_updated', {
+    # Queue real-time stock update; low-stock alerts ride on the same batch
+    stock_level = {
         'id': product.id,
         'name': product.name,
-        'stock': product.stock
-    }, broadcast=True)
-
-    # Check for low stock and emit alert
-    if product.stock < 5:
-        socketio.emit('low_stock_alert', {
-            'product_name': product.name,
-            'stock': product.stock
-        }, broadcast=True)
-
-    return jsonify(success=True, stock=product.stock)
+        'stock': stock - quantity,
+        'category_id': product.category_id
+    }
+
+    @sqlite_writer.after_commit
+    def published():
+        catalog_cache.publish(catalog_cache.PRODUCTS, version)
+        stock_broadcaster.queue([stock_level])
+        dashboard_cache.stock_changed([stock_level])
+        reservations.sync_stock([stock_level])
+        if hot_stock.is_hot(stock_level['id']):
+            hot_stock.invalidate([stock_level['id']])
+
+    return jsonify(success=True, stock=stock_level['stock'])
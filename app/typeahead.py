@@ -0,0 +1,180 @@
+# app/typeahead.py
+"""In-memory word-prefix index over product names, for type-ahead on the sales screen.
+
+A PrefixIndex is two parallel arrays sorted by key: `keys`, the normalized
+name from each word onwards ("Brookside Milk 500ml" gives "brookside milk
+500ml", "milk 500ml" and "500ml"), and `ids`, the product each key belongs
+to. The products whose name has a word starting with a query sit in one
+contiguous slice of those arrays, found with two bisects.
+
+Results are ranked by units sold over the last TYPEAHEAD_VELOCITY_DAYS
+(from the daily rollup), then by shorter name. A short query like "m"
+matches a large part of the catalog, and ranking the whole slice would cost
+milliseconds. So every prefix whose slice is longer than SCAN_LIMIT keeps
+its top TOP_K ids precomputed. Any other query ranks at most about
+1.5 x SCAN_LIMIT entries. Either way a lookup stays well under a
+millisecond.
+
+The catalog cache builds an index when it loads and swaps in updated()
+as products are created, renamed or deleted. updated() copies the sorted
+arrays, the precomputed lists and the name keys rather than editing them,
+so a reader never sees a half-applied change. The rank map is shared: it
+only ever gains or replaces entries, which a reader can see either way.
+"""
+import heapq
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from os.path import commonprefix
+from sqlalchemy import func
+from app.models import db, SalesDailyProduct
+
+TOP_K = 20  # Most results a lookup returns
+SCAN_LIMIT = 256  # Slices longer than this have their ranking precomputed
+_END = '\U0010ffff'  # Sorts after any character a key can hold
+
+
+def normalize(text):
+    """Lowercase, accents stripped, runs of anything but letters and digits folded to one space."""
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.sub(r'[\W_]+', ' ', text.casefold()).split())
+
+
+def name_keys(name):
+    words = normalize(name).split()
+    return tuple(' '.join(words[start:]) for start in range(len(words)))
+
+
+def recent_sales(days):
+    """{product_id: units sold} over the last `days` days of the daily rollup."""
+    since = datetime.utcnow().date() - timedelta(days=days)
+    return dict(db.session.query(SalesDailyProduct.product_id, func.sum(SalesDailyProduct.quantity)).filter(
+        SalesDailyProduct.day >= since).group_by(SalesDailyProduct.product_id).all())
+
+
+class PrefixIndex:
+    def __init__(self, products=(), sales=None):
+        """Index (id, name) pairs; `sales` maps product id -> recent units sold."""
+        sales = sales or {}
+        self.keys_of = {}  # id -> keys of its name
+        self.order = {}  # id -> sort key: best selling first, then shorter names
+        entries = []
+        for product_id, name in products:
+            keys = name_keys(name)
+            self.keys_of[product_id] = keys
+            self.order[product_id] = (-sales.get(product_id, 0), len(name), product_id)
+            entries.extend((key, product_id) for key in keys)
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.ids = array('q', (product_id for _, product_id in entries))
+        self.top = self._rank_heavy_prefixes(self._find_heavy_prefixes())
+
+    def _slice(self, prefix):
+        return bisect_left(self.keys, prefix), bisect_left(self.keys, prefix + _END)
+
+    def _scan(self, prefix, limit):
+        low, high = self._slice(prefix)
+        return heapq.nsmallest(limit, set(self.ids[low:high]), key=self.order.__getitem__)
+
+    def _find_heavy_prefixes(self):
+        keys, heavy = self.keys, set()
+        # Every slice at least 1.5 x SCAN_LIMIT long spans some pair of keys sampled SCAN_LIMIT apart
+        for start in range(0, len(keys) - SCAN_LIMIT, SCAN_LIMIT // 2):
+            prefix = commonprefix([keys[start], keys[start + SCAN_LIMIT]])
+            while prefix and prefix not in heavy:
+                heavy.add(prefix)
+                prefix = prefix[:-1]
+        return heavy
+
+    def _rank_heavy_prefixes(self, heavy):
+        keys, ids, top = self.keys, self.ids, {}
+        # Longest first, so each prefix merges the lists of its heavy children and scans only the rest
+        for prefix in sorted(heavy, key=len, reverse=True):
+            low, high = self._slice(prefix)
+            candidates, depth = set(), len(prefix)
+            while low < high:
+                if len(keys[low]) == depth:  # The whole key is the prefix
+                    candidates.add(ids[low])
+                    low += 1
+                    continue
+                child = prefix + keys[low][depth]
+                child_high = bisect_left(keys, child + _END, low, high)
+                if child in top:
+                    candidates.update(top[child])
+                else:
+                    candidates.update(ids[low:child_high])
+                low = child_high
+            top[prefix] = heapq.nsmallest(TOP_K, candidates, key=self.order.__getitem__)
+        return top
+
+    def reranked(self, sales):
+        """The same index ranked by new sales figures; the sorted arrays are shared, not rebuilt."""
+        index = PrefixIndex.__new__(PrefixIndex)
+        index.keys, index.ids, index.keys_of = self.keys, self.ids, self.keys_of
+        index.order = {product_id: (-sales.get(product_id, 0), length, product_id)
+                       for product_id, (_, length, _) in self.order.items() if product_id in self.keys_of}
+        index.top = index._rank_heavy_prefixes(self.top)
+        return index
+
+    def lookup(self, query, limit=TOP_K):
+        """Ids of the best-ranked products with a name word starting with `query`."""
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        ranked = self.top.get(prefix)
+        if ranked is not None:
+            return ranked[:limit]
+        return self._scan(prefix, limit)
+
+    def updated(self, removed=(), products=()):
+        """A new index without the `removed` ids and with (id, name) pairs added or renamed."""
+        products = list(products)
+        changed = set(removed) | {product_id for product_id, _ in products}
+        if not changed:
+            return self
+        index = PrefixIndex.__new__(PrefixIndex)
+        index.keys, index.ids = list(self.keys), array('q', self.ids)
+        index.keys_of, index.order, index.top = dict(self.keys_of), self.order, dict(self.top)
+
+        affected = set()
+        for product_id in changed:
+            for key in index.keys_of.pop(product_id, ()):
+                position = bisect_left(index.keys, key)
+                while index.ids[position] != product_id:
+                    position += 1
+                del index.keys[position]
+                del index.ids[position]
+                affected.update(_heavy_prefixes(index.top, key))
+
+        added = {}
+        for product_id, name in products:
+            sold = -self.order[product_id][0] if product_id in self.order else 0
+            keys = index.keys_of[product_id] = name_keys(name)
+            index.order[product_id] = (-sold, len(name), product_id)
+            for key in keys:
+                position = bisect_right(index.keys, key)
+                index.keys.insert(position, key)
+                index.ids.insert(position, product_id)
+                for prefix in _heavy_prefixes(index.top, key):
+                    affected.add(prefix)
+                    added.setdefault(prefix, set()).add(product_id)
+
+        for prefix in affected:
+            ranked = self.top[prefix]
+            if changed.intersection(ranked):
+                index.top[prefix] = index._scan(prefix, TOP_K)  # A ranked product left: rank the slice again
+            else:
+                index.top[prefix] = heapq.nsmallest(TOP_K, set(ranked) | added.get(prefix, set()),
+                                                    key=index.order.__getitem__)
+        return index
+
+
+def _heavy_prefixes(top, key):
+    for end in range(1, len(key) + 1):
+        if key[:end] not in top:
+            return
+        yield key[:end]
@@ -0,0 +1,195 @@
+# app/writer.py
+"""Single-writer queue for SQLite deployments.
+
+SQLite allows one writer at a time. With SQLITE_SINGLE_WRITER set, write
+requests no longer race for the lock. They are queued to one writer task
+that owns the write connection, and each caller waits for its turn. The
+writer takes up to SQLITE_WRITE_BATCH_SIZE queued jobs and runs them in FIFO
+order inside one database transaction. Each job gets its own SAVEPOINT:
+a job's commit() releases the savepoint and its rollback() undoes only that
+job. Jobs share the batch session, which is expired before each one so it
+reads what earlier jobs wrote. The batch is committed once, and then every
+waiting caller is answered, so a response still means the write is durable.
+
+A job's commit() is not durable until its batch commits. Side effects
+outside the database (Redis, caches, Socket.IO, the session cookie) go
+through sqlite_writer.after_commit(), which holds them until then and drops
+them if the batch fails. after_rollback() registers the undo of something a
+job did before it committed, such as taking stock from a Redis counter.
+Outside a batch the first runs at once and the second never runs.
+
+Views opt in with @sqlite_writer.serialize; other code passes a closure to
+sqlite_writer.run(). Both run inline when the writer is disabled.
+"""
+import functools
+from flask import request, has_request_context, _request_ctx_stack, _app_ctx_stack
+from sqlalchemy import event
+from app import db, socketio
+from app.cooperative_db import unwrap
+
+# Same task identity Flask-SQLAlchemy scopes its sessions by
+try:
+    from greenlet import getcurrent as _task_ident
+except ImportError:
+    from threading import get_ident as _task_ident
+
+
+class SingleWriter:
+    def __init__(self, socketio):
+        self.socketio = socketio
+        self.enabled = False
+        self._writer_task = None
+        self._after_commit, self._after_rollback = [], []
+
+    def init_app(self, app):
+        if not app.config.get('SQLITE_SINGLE_WRITER'):
+            return
+        with app.app_context():
+            if db.engine.dialect.name != 'sqlite':
+                return
+        if app.config.get('CHECKOUT_PIPELINE'):
+            raise ValueError('CHECKOUT_PIPELINE already serializes checkout commits; '
+                             'enable it or SQLITE_SINGLE_WRITER, not both')
+        self.enabled = True
+        self.batch_size = app.config['SQLITE_WRITE_BATCH_SIZE']
+        # engineio's primitives match the Socket.IO async mode (eventlet, gevent or threads)
+        primitives = self.socketio.server.eio._async
+        self._queue = primitives['queue']()
+        self._queue_empty = primitives['queue_empty']
+        self._event = primitives['event']
+        self.socketio.start_background_task(self._run, app)
+
+    def run(self, fn):
+        """Run a write closure on the writer and return its result; inline when disabled."""
+        if not self.enabled or self._in_writer():
+            return fn()
+        slot = {'fn': fn, 'done': self._event(), 'result': None, 'error': None}
+        self._queue.put(slot)
+        slot['done'].wait()
+        if slot['error'] is not None:
+            raise slot['error']
+        return slot['result']
+
+    def after_commit(self, fn, *args):
+        """Call fn(*args) once the write just committed is durable; usable as a decorator."""
+        if self.enabled and self._in_writer():
+            self._after_commit.append(self._deferred(fn, args))
+        else:
+            fn(*args)
+        return fn
+
+    def after_rollback(self, fn, *args):
+        """Call fn(*args) if the batch holding the write just committed fails to commit."""
+        if self.enabled and self._in_writer():
+            self._after_rollback.append(self._deferred(fn, args))
+        return fn
+
+    @staticmethod
+    def _deferred(fn, args):
+        # Callbacks run after the job's request context is gone, so they take a copy of it
+        ctx = _request_ctx_stack.top.copy() if has_request_context() else None
+        return ctx, fn, args
+
+    def serialize(self, view):
+        """Run a view's writes (non-GET requests) on the writer, in a copy of the request context."""
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled or request.method in ('GET', 'HEAD'):
+                return view(*args, **kwargs)
+            ctx = _request_ctx_stack.top.copy()
+
+            def job():
+                # The writer's app context is already pushed, so this push adds no app context
+                # and popping it never tears down the shared batch session
+                _app_ctx_stack.top.g = _app_ctx_stack.top.app.app_ctx_globals_class()
+                with ctx:
+                    return view(*args, **kwargs)
+            return self.run(job)
+        return wrapper
+
+    def _in_writer(self):
+        return _task_ident() == self._writer_task
+
+    def _run(self, app):
+        self._writer_task = _task_ident()
+        with app.app_context():
+            connection = None
+            while True:
+                slots = [self._queue.get()]
+                while len(slots) < self.batch_size:
+                    try:
+                        slots.append(self._queue.get_nowait())
+                    except self._queue_empty:
+                        break
+                if connection is None or connection.closed or connection.invalidated:
+                    connection = _write_connection()
+                self._run_batch(app, connection, slots)
+
+    def _run_batch(self, app, connection, slots):
+        # Flask-SQLAlchemy binds every table to db.engine unless told otherwise; those binds
+        # would take the ORM's statements off the writer's connection
+        session = db.session.session_factory(bind=connection, binds={})
+        db.session.registry.set(session)
+
+        # Keep a savepoint open at all times, so a job's commit() or rollback() only ever
+        # ends its own savepoint and never the batch transaction
+        def restart_savepoint(session, transaction):
+            if transaction.nested and not transaction._parent.nested:
+                session.begin_nested()
+
+        try:
+            session.begin_nested()
+            event.listen(session, 'after_transaction_end', restart_savepoint)
+            for slot in slots:
+                # Earlier jobs may have changed rows behind the identity map with Core UPDATEs
+                session.expire_all()
+                try:
+                    slot['result'] = slot['fn']()
+                except Exception as e:
+                    slot['error'] = e
+                session.rollback()  # Drops whatever the job left uncommitted, like request teardown
+            event.remove(session, 'after_transaction_end', restart_savepoint)
+            session.commit()  # Releases the idle savepoint
+            session.commit()  # Commits the batch
+        except Exception as e:
+            app.logger.exception('Single-writer batch failed to commit')
+            connection.close()  # Rolls back whatever is open; the next batch reconnects
+            for slot in slots:
+                slot['result'], slot['error'] = None, slot['error'] or e
+            self._run_callbacks(app, self._after_rollback)
+        else:
+            self._run_callbacks(app, self._after_commit)
+        finally:
+            self._after_commit, self._after_rollback = [], []
+            db.session.remove()
+            for slot in slots:
+                slot['done'].set()
+
+    def _run_callbacks(self, app, callbacks):
+        for ctx, fn, args in callbacks:
+            try:
+                if ctx is None:
+                    fn(*args)
+                    continue
+                _app_ctx_stack.top.g = app.app_ctx_globals_class()
+                with ctx:
+                    fn(*args)
+            except Exception:
+                app.logger.exception('Single-writer callback failed')
+
+
+def _write_connection():
+    """A connection of the writer's own, taken out of the pool.
+
+    pysqlite's implicit transactions do not nest SAVEPOINTs inside a real
+    transaction, so they are turned off and every transaction begins with
+    BEGIN IMMEDIATE, which also takes the write lock up front.
+    """
+    connection = db.engine.connect()
+    connection.detach()
+    unwrap(connection.connection.dbapi_connection).isolation_level = None
+    event.listen(connection, 'begin', lambda conn: conn.exec_driver_sql('BEGIN IMMEDIATE'))
+    return connection
+
+
+sqlite_writer = SingleWriter(socketio)
@@ -0,0 +1,143 @@
+# benchmarks/add_to_cart.py
+"""Requests/s for /sales/add_to_cart, with 50 tills tapping at once.
+
+Serves the app with eventlet's WSGI server and drives it from --tills
+keep-alive client greenthreads in the same process. The clients hit the
+current view (in-memory catalog, no user load) and, for comparison, a copy
+of the previous one (login_required plus Product.query.get) mounted at
+/bench/add_to_cart. Redis is left out so only the request path is measured;
+with Redis every tap also makes its reservation round trip. The catalog
+cache is marked as subscribed, which is its steady state with Redis up;
+unsubscribed, it checks catalog versions with a query on every read.
+
+    python benchmarks/add_to_cart.py --tills 50 --seconds 10
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+import eventlet
+import eventlet.wsgi
+from eventlet.green.http import client as http_client
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from flask import jsonify, request  # noqa: E402
+from flask_login import login_required  # noqa: E402
+from flask_migrate import upgrade  # noqa: E402
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Category, Product, User, Role  # noqa: E402
+
+PRODUCTS = 2000
+
+
+def make_app():
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+        SOCKETIO_MESSAGE_QUEUE = None
+        SQLITE_PROFILE = 'production'
+        RATELIMIT_ENABLED = False
+
+    app = create_app(BenchConfig)
+    app.logger.disabled = True
+    app.extensions['redis'] = None
+    app.extensions['catalog_cache'].listening = True  # One process: nobody else publishes
+    app.add_url_rule('/bench/add_to_cart', 'bench_add_to_cart', orm_add_to_cart, methods=['POST'])
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        user = User(username='bench', role=Role.CASHIER)
+        user.set_password('bench')
+        category = Category(name='Bench')
+        db.session.add_all([user, category])
+        db.session.flush()
+        db.session.execute(Product.__table__.insert(), [
+            {'name': f'Product {i}', 'price': 10.0, 'stock': 10 ** 7, 'category_id': category.id, 'catalog_version': 0}
+            for i in range(PRODUCTS)
+        ])
+        db.session.commit()
+    return app
+
+
+@login_required
+def orm_add_to_cart():
+    """The view as it was before the fast path, without the Redis reservation."""
+    data = request.json
+    product = Product.query.get(data.get('product_id'))
+    if not product:
+        return jsonify({'success': False, 'message': 'Product not found'}), 404
+    if product.stock < data.get('quantity', 1):
+        return jsonify({'success': False, 'message': 'Insufficient stock'}), 400
+    quantity = data.get('quantity', 1)
+    return jsonify({
+        'success': True,
+        'product_id': product.id,
+        'product_name': product.name,
+        'quantity': quantity,
+        'price': product.price,
+        'total_price': product.price * quantity
+    })
+
+
+def login(port):
+    connection = http_client.HTTPConnection('127.0.0.1', port)
+    connection.request('POST', '/auth/login', urlencode({'username': 'bench', 'password': 'bench'}),
+                       {'Content-Type': 'application/x-www-form-urlencoded'})
+    response = connection.getresponse()
+    response.read()
+    cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+    connection.close()
+    return cookie
+
+
+def run(port, cookie, path, tills, seconds):
+    counts = {'ok': 0, 'failed': 0}
+    deadline = time.perf_counter() + seconds
+
+    def till(number):
+        connection = http_client.HTTPConnection('127.0.0.1', port)
+        headers = {'Content-Type': 'application/json', 'Cookie': cookie}
+        tap = 0
+        while time.perf_counter() < deadline:
+            body = json.dumps({'product_id': (number * 37 + tap) % PRODUCTS + 1, 'quantity': 1})
+            connection.request('POST', path, body, headers)
+            response = connection.getresponse()
+            response.read()
+            counts['ok' if response.status == 200 else 'failed'] += 1
+            tap += 1
+        connection.close()
+
+    pool = eventlet.GreenPool(tills)
+    for number in range(tills):
+        pool.spawn(till, number)
+    pool.waitall()
+    return counts['ok'] / seconds, counts['failed']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tills', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    app = make_app()
+    listener = eventlet.listen(('127.0.0.1', 0))
+    port = listener.getsockname()[1]
+    eventlet.spawn(eventlet.wsgi.server, listener, app, log_output=False)
+    cookie = login(port)
+    run(port, cookie, '/sales/add_to_cart', args.tills, 1)  # Warm the catalog and connections
+
+    print(f'{args.tills} tills tapping for {args.seconds:g}s each')
+    print(f'{"path":<26}{"requests/s":>12}{"failed":>8}')
+    for label, path in (('before (ORM, user load)', '/bench/add_to_cart'), ('after (fast path)', '/sales/add_to_cart')):
+        rate, failed = run(port, cookie, path, args.tills, args.seconds)
+        print(f'{label:<26}{rate:>12.1f}{failed:>8}')
+
+
+if __name__ == '__main__':
+    main()
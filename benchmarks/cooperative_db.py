@@ -0,0 +1,109 @@
+# benchmarks/cooperative_db.py
+"""Does a slow report query stall concurrent checkouts on the eventlet hub?
+
+One greenthread runs a report query that takes about --slow seconds while
+another keeps running place_sale() and a third measures how late the hub
+wakes it from 10 ms sleeps. Runs once with plain driver calls and once with
+COOPERATIVE_DB. Without it the hub freezes for the whole query; with it
+checkouts keep completing.
+
+    python benchmarks/cooperative_db.py --slow 2
+    DATABASE_URL=postgresql://... python benchmarks/cooperative_db.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import eventlet
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from flask_migrate import upgrade  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Category, Product  # noqa: E402
+from app.checkout import place_sale  # noqa: E402
+
+
+def make_app(cooperative):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL') or f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+        SOCKETIO_MESSAGE_QUEUE = None
+        SQLITE_PROFILE = 'production'  # WAL, so the report reader never blocks the checkout writer
+        COOPERATIVE_DB = cooperative
+
+    app = create_app(BenchConfig)
+    app.logger.disabled = True
+    app.extensions['redis'] = None
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        category = Category.query.filter_by(name='Bench').first() or Category(name='Bench')
+        db.session.add(category)
+        db.session.flush()
+        product = Product(name=f'Bench {time.time()}', price=1.0, stock=10 ** 7, category_id=category.id)
+        db.session.add(product)
+        db.session.commit()
+        return app, product.id
+
+
+def slow_query(seconds):
+    if db.engine.dialect.name == 'postgresql':
+        return text(f'SELECT pg_sleep({seconds})')
+    # Roughly 2.5M rows/s of recursive CTE on current hardware; calibrated below
+    return text('WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c WHERE x < :n) '
+                'SELECT count(*) FROM c').bindparams(n=int(seconds * 2500000))
+
+
+def run(app, product_id, seconds):
+    done = {'checkouts': 0, 'max_gap': 0.0}
+    finished = eventlet.event.Event()
+
+    def report():
+        with app.app_context():
+            started = time.perf_counter()
+            db.session.execute(slow_query(seconds)).scalar()
+            done['report_seconds'] = time.perf_counter() - started
+            db.session.remove()
+        finished.send()
+
+    def checkouts():
+        with app.app_context():
+            while not finished.ready():
+                place_sale([{'id': product_id, 'quantity': 1}])
+                done['checkouts'] += 1
+                eventlet.sleep(0)
+            db.session.remove()
+
+    def heartbeat():
+        while not finished.ready():
+            before = time.perf_counter()
+            eventlet.sleep(0.01)
+            done['max_gap'] = max(done['max_gap'], time.perf_counter() - before - 0.01)
+
+    threads = [eventlet.spawn(heartbeat), eventlet.spawn(checkouts)]
+    eventlet.sleep(0.05)
+    threads.append(eventlet.spawn(report))
+    for thread in threads:
+        thread.wait()
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--slow', type=float, default=2.0, help='Target seconds for the report query')
+    args = parser.parse_args()
+
+    print(f'{"mode":<13}{"report s":>10}{"checkouts during":>18}{"max hub stall s":>17}')
+    for cooperative in (False, True):
+        app, product_id = make_app(cooperative)
+        result = run(app, product_id, args.slow)
+        mode = 'cooperative' if cooperative else 'blocking'
+        print(f'{mode:<13}{result["report_seconds"]:>10.2f}{result["checkouts"]:>18}{result["max_gap"]:>17.3f}')
+
+
+if __name__ == '__main__':
+    main()
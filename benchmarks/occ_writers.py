@@ -0,0 +1,103 @@
+# benchmarks/occ_writers.py
+"""Concurrent writers against one product: optimistic retry vs conditional UPDATE.
+
+Each writer takes one unit of stock per operation, either the way
+update_stock does it (ORM read-modify-write on the versioned row, retried
+by retry_on_stale) or the way checkout does it (a single conditional
+UPDATE). Reports throughput, conflict rate, and whether any update was lost.
+
+    python benchmarks/occ_writers.py --writers 20 --ops 50
+    DATABASE_URL=postgresql://... python benchmarks/occ_writers.py
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Category, Product  # noqa: E402
+from app.checkout import decrement_stock  # noqa: E402
+from app.concurrency import retry_on_stale  # noqa: E402
+
+
+class BenchConfig(Config):
+    SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL') or f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+    SQLALCHEMY_ENGINE_OPTIONS = {'connect_args': {'timeout': 30}} if SQLALCHEMY_DATABASE_URI.startswith('sqlite') else {}
+    SOCKETIO_MESSAGE_QUEUE = None
+
+
+def setup(app, stock):
+    with app.app_context():
+        db.metadata.create_all(bind=db.engine, tables=[Category.__table__, Product.__table__])
+        category = Category.query.filter_by(name='Bench').first() or Category(name='Bench')
+        db.session.add(category)
+        db.session.flush()
+        product = Product(name='Bench product', price=1.0, stock=stock, category_id=category.id)
+        db.session.add(product)
+        db.session.commit()
+        return product.id
+
+
+def run(app, product_id, mode, writers, ops):
+    attempts = [0]
+    lock = threading.Lock()
+
+    @retry_on_stale(attempts=100)
+    def occ_take():
+        with lock:
+            attempts[0] += 1
+        product = db.session.get(Product, product_id)
+        product.stock -= 1
+        db.session.commit()
+
+    def conditional_take():
+        with lock:
+            attempts[0] += 1
+        decrement_stock(product_id, 1)
+        db.session.commit()
+
+    take = occ_take if mode == 'occ' else conditional_take
+
+    def writer():
+        with app.app_context():
+            for _ in range(ops):
+                take()
+            db.session.remove()
+
+    threads = [threading.Thread(target=writer) for _ in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - started, attempts[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=20)
+    parser.add_argument('--ops', type=int, default=50, help='Operations per writer')
+    args = parser.parse_args()
+
+    app = create_app(BenchConfig)
+    app.logger.disabled = True
+    total = args.writers * args.ops
+    print(f'{args.writers} writers x {args.ops} ops on one product ({app.config["SQLALCHEMY_DATABASE_URI"].split(":")[0]})')
+    print(f'{"mode":<12}{"ops/s":>10}{"attempts":>10}{"conflicts":>11}{"lost":>6}')
+    for mode in ('occ', 'conditional'):
+        start_stock = total * 2
+        product_id = setup(app, start_stock)
+        elapsed, attempts = run(app, product_id, mode, args.writers, args.ops)
+        with app.app_context():
+            lost = db.session.get(Product, product_id).stock - (start_stock - total)
+        conflict_rate = (attempts - total) / attempts
+        print(f'{mode:<12}{total / elapsed:>10.0f}{attempts:>10}{conflict_rate:>10.1%}{lost:>6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+# benchmarks/product_search.py
+"""Latency of /sales/api/products/search's lookup on a large catalog.
+
+Builds a database with the migrations, loads --products generated product
+names, rebuilds the search index and times search.product_ids() against the
+LIKE '%q%' scan it replaces, for two kinds of query: common substrings of
+real names ("Milk", "ra Sug"), which the scan answers quickly because 20
+matches turn up early, and rare ones (a single product's "#4711" tag), for
+which the scan reads the whole table.
+
+    python benchmarks/product_search.py --products 100000 --queries 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from flask_migrate import upgrade  # noqa: E402
+from config import Config  # noqa: E402
+from app import create_app, db, search  # noqa: E402
+from app.models import Category, Product  # noqa: E402
+
+BRANDS = ['Kabras', 'Brookside', 'Daima', 'Elianto', 'Jogoo', 'Ketepa', 'Menengai', 'Fresha', 'Tuzo', 'Pembe',
+          'Kimbo', 'Festive', 'Supaloaf', 'Molo', 'Tropical', 'Ramtons', 'Sunlight', 'Omo', 'Geisha', 'Royco']
+ITEMS = ['Sugar', 'Milk', 'Bread', 'Maize Flour', 'Tea Leaves', 'Cooking Oil', 'Wheat Flour', 'Soap', 'Rice',
+         'Yoghurt', 'Butter', 'Juice', 'Biscuits', 'Detergent', 'Salt', 'Margarine', 'Spaghetti', 'Coffee']
+SIZES = ['250g', '500g', '1kg', '2kg', '500ml', '1L', '2L', '5L', '100g', '10 pack']
+
+
+def make_app(products):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+        SOCKETIO_MESSAGE_QUEUE = None
+        SQLITE_PROFILE = 'production'
+
+    app = create_app(BenchConfig)
+    app.logger.disabled = True
+    app.extensions['redis'] = None
+    rng = random.Random(1)
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        category = Category(name='Bench')
+        db.session.add(category)
+        db.session.flush()
+        names = [f'{rng.choice(BRANDS)} {rng.choice(ITEMS)} {rng.choice(SIZES)} #{i}' for i in range(products)]
+        db.session.execute(Product.__table__.insert(), [
+            {'name': name, 'price': 10.0, 'stock': 100, 'category_id': category.id, 'catalog_version': 0}
+            for name in names
+        ])
+        db.session.commit()
+        search.rebuild()
+    return app, names
+
+
+def timed(operation, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        operation(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95)], timings[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    app, names = make_app(args.products)
+    rng = random.Random(2)
+    common = []
+    while len(common) < args.queries:
+        name = rng.choice(names).split(' #')[0]
+        start = rng.randrange(0, len(name) - 3)
+        query = name[start:start + rng.randint(3, 6)].strip()
+        if len(query) >= search.MIN_INDEXED_LENGTH:
+            common.append(query)
+    rare = [f'#{rng.randrange(args.products)}' for _ in range(args.queries)]
+
+    def like_scan(query):
+        return [row.id for row in db.session.query(Product.id).filter(Product.name.ilike(f'%{query}%')).limit(20)]
+
+    print(f'{args.products} products, {args.queries} queries of each kind, top 20 results')
+    print(f'{"queries":<9}{"lookup":<18}{"p50 ms":>9}{"p95 ms":>9}{"max ms":>9}')
+    with app.app_context():
+        for kind, queries in (('common', common), ('rare', rare)):
+            for label, operation in (("LIKE '%q%' scan", like_scan), ('search index', search.product_ids)):
+                p50, p95, worst = timed(operation, queries)
+                print(f'{kind:<9}{label:<18}{p50:>9.2f}{p95:>9.2f}{worst:>9.2f}')
+
+
+if __name__ == '__main__':
+    main()
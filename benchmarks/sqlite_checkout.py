@@ -0,0 +1,125 @@
+# benchmarks/sqlite_checkout.py
+"""Checkout throughput on SQLite with the default connection settings vs SQLITE_PROFILE=production.
+
+Writer threads run place_sale() while reader threads run a report-style
+aggregate over cart_items, for a fixed time, against a fresh database built
+by the migrations and seeded with some sales history. Reports checkouts/s,
+report queries/s and how many operations failed with "database is locked".
+
+    python benchmarks/sqlite_checkout.py --writers 8 --readers 4 --seconds 10
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from flask_migrate import upgrade  # noqa: E402
+from sqlalchemy import func  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+from config import Config  # noqa: E402
+from app import create_app, db  # noqa: E402
+from app.models import Category, Product, Sale, CartItem  # noqa: E402
+from app.checkout import place_sale, CheckoutError  # noqa: E402
+
+PRODUCTS = 200
+
+
+def make_app(profile):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+        SOCKETIO_MESSAGE_QUEUE = None
+        SQLITE_PROFILE = profile
+
+    app = create_app(BenchConfig)
+    app.logger.disabled = True
+    app.extensions['redis'] = None  # Measure the database, not Redis
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        seed()
+    return app
+
+
+def seed(history=5000):
+    category = Category(name='Bench')
+    db.session.add(category)
+    db.session.flush()
+    db.session.execute(Product.__table__.insert(), [
+        {'name': f'Product {i}', 'price': 10.0, 'stock': 10 ** 7, 'category_id': category.id, 'catalog_version': 0}
+        for i in range(PRODUCTS)
+    ])
+    db.session.execute(Sale.__table__.insert(), [
+        {'date': datetime.utcnow(), 'total': 10.0, 'payment_method': 'cash'} for _ in range(history)
+    ])
+    db.session.execute(CartItem.__table__.insert(), [
+        {'sale_id': i + 1, 'product_id': random.randint(1, PRODUCTS), 'quantity': 1, 'unit_price': 10.0}
+        for i in range(history)
+    ])
+    db.session.commit()
+
+
+def report_query():
+    return db.session.query(CartItem.product_id, func.sum(CartItem.quantity * CartItem.unit_price)).join(
+        Sale, CartItem.sale_id == Sale.id).group_by(CartItem.product_id).all()
+
+
+def run(app, writers, readers, seconds):
+    counts = {'checkouts': 0, 'reports': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def loop(operation, counter):
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                try:
+                    operation()
+                    key = counter
+                except OperationalError:
+                    db.session.rollback()
+                    key = 'locked'
+                with lock:
+                    counts[key] += 1
+            db.session.remove()
+
+    def checkout():
+        cart = [{'id': random.randint(1, PRODUCTS), 'quantity': 1} for _ in range(random.randint(1, 3))]
+        try:
+            place_sale(cart)
+        except CheckoutError:
+            pass
+
+    def report():
+        report_query()
+        db.session.rollback()  # End the read transaction like a request would
+
+    threads = [threading.Thread(target=loop, args=(checkout, 'checkouts')) for _ in range(writers)]
+    threads += [threading.Thread(target=loop, args=(report, 'reports')) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {key: value / seconds if key != 'locked' else value for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--writers', type=int, default=8)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f'{args.writers} checkout writers, {args.readers} report readers, {args.seconds:g}s each')
+    print(f'{"profile":<12}{"checkouts/s":>13}{"reports/s":>11}{"locked":>8}')
+    for profile in ('', 'production'):
+        result = run(make_app(profile), args.writers, args.readers, args.seconds)
+        print(f'{profile or "default":<12}{result["checkouts"]:>13.1f}{result["reports"]:>11.1f}{result["locked"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
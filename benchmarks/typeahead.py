@@ -0,0 +1,126 @@
+# benchmarks/typeahead.py
+"""Latency of /sales/api/products/typeahead's lookup on a large catalog.
+
+Builds a database with the migrations, loads --products generated product
+names with a few weeks of daily sales rollups, and times
+catalog_cache.typeahead() for every prefix of real names as a cashier types
+them ("k", "ka", "kab", ...). The FTS search it sits in front of is timed on
+the same prefixes from three characters. Also reports how long the index
+takes to build, to take in a renamed product, and to rank again by fresh
+sales figures (every TYPEAHEAD_RANKING_INTERVAL).
+
+    python benchmarks/typeahead.py --products 100000 --queries 500
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from flask_migrate import upgrade  # noqa: E402
+from config import Config  # noqa: E402
+from app import create_app, db, search, catalog_cache, typeahead  # noqa: E402
+from app.models import Category, Product, SalesDailyProduct  # noqa: E402
+
+BRANDS = ['Kabras', 'Brookside', 'Daima', 'Elianto', 'Jogoo', 'Ketepa', 'Menengai', 'Fresha', 'Tuzo', 'Pembe',
+          'Kimbo', 'Festive', 'Supaloaf', 'Molo', 'Tropical', 'Ramtons', 'Sunlight', 'Omo', 'Geisha', 'Royco']
+ITEMS = ['Sugar', 'Milk', 'Bread', 'Maize Flour', 'Tea Leaves', 'Cooking Oil', 'Wheat Flour', 'Soap', 'Rice',
+         'Yoghurt', 'Butter', 'Juice', 'Biscuits', 'Detergent', 'Salt', 'Margarine', 'Spaghetti', 'Coffee']
+SIZES = ['250g', '500g', '1kg', '2kg', '500ml', '1L', '2L', '5L', '100g', '10 pack']
+
+
+def make_app(products):
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+        SOCKETIO_MESSAGE_QUEUE = None
+        SQLITE_PROFILE = 'production'
+
+    app = create_app(BenchConfig)
+    app.logger.disabled = True
+    app.extensions['redis'] = None
+    app.extensions['catalog_cache'].listening = True  # One process: nobody else publishes
+    rng = random.Random(1)
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        category = Category(name='Bench')
+        db.session.add(category)
+        db.session.flush()
+        names = [f'{rng.choice(BRANDS)} {rng.choice(ITEMS)} {rng.choice(SIZES)} #{i}' for i in range(products)]
+        db.session.execute(Product.__table__.insert(), [
+            {'name': name, 'price': 10.0, 'stock': 100, 'category_id': category.id, 'catalog_version': 0}
+            for name in names
+        ])
+        # A long tail: a tenth of the catalog sold something on each of the last 14 days
+        today = datetime.utcnow().date()
+        db.session.execute(SalesDailyProduct.__table__.insert(), [
+            {'day': today - timedelta(days=day), 'product_id': product_id, 'quantity': rng.randint(1, 50),
+             'revenue': 0.0}
+            for day in range(14) for product_id in rng.sample(range(1, products + 1), products // 10)
+        ])
+        db.session.commit()
+        search.rebuild()
+    return app, names
+
+
+def timed(operation, queries):
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        operation(query)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return statistics.median(timings), timings[int(len(timings) * 0.95)], timings[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--products', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=500)
+    args = parser.parse_args()
+
+    app, names = make_app(args.products)
+    rng = random.Random(2)
+    typed = []
+    for _ in range(args.queries):
+        words = rng.choice(names).split()
+        word = ' '.join(words[rng.randrange(len(words) - 1):])
+        typed.extend(word[:end] for end in range(1, min(len(word), 8) + 1))
+    indexed = [query for query in typed if len(query) >= search.MIN_INDEXED_LENGTH]
+
+    with app.app_context():
+        started = time.perf_counter()
+        catalog_cache.typeahead('warm')  # Loads the catalog and builds the index
+        load = (time.perf_counter() - started) * 1000
+        snapshot = app.extensions['catalog_cache']
+        started = time.perf_counter()
+        index = typeahead.PrefixIndex(((p.id, p.name) for p in snapshot.products.values()),
+                                      typeahead.recent_sales(14))
+        build = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        index.reranked(typeahead.recent_sales(7))
+        rerank = (time.perf_counter() - started) * 1000
+        started = time.perf_counter()
+        for product_id in range(1, 21):
+            index = index.updated(products=[(product_id, f'Renamed {product_id}')])
+        rename = (time.perf_counter() - started) * 1000 / 20
+
+        print(f'{args.products} products, {len(typed)} type-ahead prefixes, top 10 results')
+        print(f'catalog load + index build {load:.0f} ms, index build {build:.0f} ms, rerank {rerank:.0f} ms, '
+              f'one rename {rename:.2f} ms, {len(index.top)} precomputed prefixes')
+        print(f'{"lookup":<28}{"queries":>8}{"p50 ms":>9}{"p95 ms":>9}{"max ms":>9}')
+        for label, operation, queries in (
+                ('FTS search (3+ chars)', lambda query: search.product_ids(query, 10), indexed),
+                ('type-ahead (3+ chars)', lambda query: catalog_cache.typeahead(query, 10), indexed),
+                ('type-ahead (every prefix)', lambda query: catalog_cache.typeahead(query, 10), typed)):
+            p50, p95, worst = timed(operation, queries)
+            print(f'{label:<28}{len(queries):>8}{p50:>9.3f}{p95:>9.3f}{worst:>9.3f}')
+
+
+if __name__ == '__main__':
+    main()
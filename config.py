@@ -15,6 +15,9 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///mini_supermarket.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Rotating application log, written when the app is not in debug mode
+    LOG_FILE = os.getenv('LOG_FILE', 'app.log')
+
     # Redis configuration
     REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
     REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
@@ -23,3 +26,50 @@ class Config:
     # Flask-SocketIO configurations
     SOCKETIO_MESSAGE_QUEUE = os.getenv('REDIS_URL', f'redis://{REDIS_HOST}:{REDIS_PORT}')
 
+    # Seconds of stock changes coalesced into one stock_updated_batch emit
+    STOCK_BROADCAST_WINDOW = float(os.getenv('STOCK_BROADCAST_WINDOW', 0.15))
+
+    # Seconds a till's cart reservation lives without activity, and the Redis stock mirror TTL
+    RESERVATION_TTL = int(os.getenv('RESERVATION_TTL', 900))
+    STOCK_MIRROR_TTL = int(os.getenv('STOCK_MIRROR_TTL', 600))
+
+    # Opt-in write-behind stock: comma-separated product ids whose stock is taken from Redis
+    # counters at checkout and flushed to the database every HOT_STOCK_FLUSH_INTERVAL seconds
+    HOT_STOCK_PRODUCTS = {int(pid) for pid in os.getenv('HOT_STOCK_PRODUCTS', '').split(',') if pid.strip()}
+    HOT_STOCK_FLUSH_INTERVAL = float(os.getenv('HOT_STOCK_FLUSH_INTERVAL', 2))
+
+    # Seconds between background compactions of the stock movement ledger; 0 leaves it to `flask ledger compact`
+    LEDGER_COMPACTION_INTERVAL = float(os.getenv('LEDGER_COMPACTION_INTERVAL', 3600))
+
+    # Seconds a checkout Idempotency-Key is answered from Redis before falling back to the sales table
+    IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 86400))
+
+    # Group-commit checkout: '' commits each sale in its request, 'local' or 'redis' queues it for
+    # a committer that records up to CHECKOUT_GROUP_SIZE sales per transaction
+    CHECKOUT_PIPELINE = os.getenv('CHECKOUT_PIPELINE', '')
+    CHECKOUT_GROUP_SIZE = int(os.getenv('CHECKOUT_GROUP_SIZE', 50))
+    CHECKOUT_PIPELINE_TIMEOUT = float(os.getenv('CHECKOUT_PIPELINE_TIMEOUT', 10))
+
+    # SQLite connection profile: 'production' enables WAL, synchronous=NORMAL, mmap, a larger page
+    # cache, in-memory temp tables and a busy timeout, plus periodic checkpoint and PRAGMA optimize
+    SQLITE_PROFILE = os.getenv('SQLITE_PROFILE', '')
+    SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+    SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))  # Milliseconds
+    SQLITE_MAINTENANCE_INTERVAL = float(os.getenv('SQLITE_MAINTENANCE_INTERVAL', 300))
+
+    # Queue SQLite writes to one writer task that commits up to SQLITE_WRITE_BATCH_SIZE of them at once
+    SQLITE_SINGLE_WRITER = os.getenv('SQLITE_SINGLE_WRITER', '').lower() in ('1', 'true', 'yes')
+    SQLITE_WRITE_BATCH_SIZE = int(os.getenv('SQLITE_WRITE_BATCH_SIZE', 32))
+
+    # Under eventlet, let database calls yield to the hub: psycopg2 wait callback or SQLite via tpool
+    COOPERATIVE_DB = os.getenv('COOPERATIVE_DB', '').lower() in ('1', 'true', 'yes')
+
+    # Per-worker catalog copy for the sales screen, kept current over Redis pub/sub; workers also
+    # compare catalog versions every CATALOG_CACHE_CHECK_INTERVAL seconds in case a message was missed
+    CATALOG_CACHE = os.getenv('CATALOG_CACHE', '1').lower() in ('1', 'true', 'yes')
+    CATALOG_CACHE_CHECK_INTERVAL = float(os.getenv('CATALOG_CACHE_CHECK_INTERVAL', 15))
+
+    # Type-ahead ranks products by units sold over this many days, re-read every interval (seconds)
+    TYPEAHEAD_VELOCITY_DAYS = int(os.getenv('TYPEAHEAD_VELOCITY_DAYS', 14))
+    TYPEAHEAD_RANKING_INTERVAL = float(os.getenv('TYPEAHEAD_RANKING_INTERVAL', 300))
@@ -0,0 +1,86 @@
+"""add sales rollup tables
+
+Revision ID: 3f9a1c2d4b10
+Revises: 7e692c41b880
+Create Date: 2026-10-18 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2d4b10'
+down_revision = '7e692c41b880'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sales_daily_product',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ),
+    sa.PrimaryKeyConstraint('day', 'product_id')
+    )
+    op.create_table('sales_hourly',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('hour', sa.Integer(), nullable=False),
+    sa.Column('sale_count', sa.Integer(), nullable=False),
+    sa.Column('items_sold', sa.Integer(), nullable=False),
+    sa.Column('revenue', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'hour')
+    )
+    _backfill()
+
+
+def _backfill():
+    """Fold the existing sales history into the new tables, like `flask rollups rebuild`.
+
+    cart_items has no unit_price yet at this revision; line revenue uses the
+    catalog price, which is what the next revision snapshots onto old lines.
+    """
+    sales = sa.table('sales', sa.column('id', sa.Integer), sa.column('date', sa.DateTime),
+                     sa.column('total', sa.Float))
+    cart_items = sa.table('cart_items', sa.column('sale_id', sa.Integer), sa.column('product_id', sa.Integer),
+                          sa.column('quantity', sa.Integer))
+    products = sa.table('products', sa.column('id', sa.Integer), sa.column('price', sa.Float))
+    daily = sa.table('sales_daily_product', sa.column('day', sa.Date), sa.column('product_id', sa.Integer),
+                     sa.column('quantity', sa.Integer), sa.column('revenue', sa.Float))
+    hourly = sa.table('sales_hourly', sa.column('day', sa.Date), sa.column('hour', sa.Integer),
+                      sa.column('sale_count', sa.Integer), sa.column('items_sold', sa.Integer),
+                      sa.column('revenue', sa.Float))
+    sale_day = sa.func.date(sales.c.date)
+    sale_hour = sa.extract('hour', sales.c.date)
+
+    op.execute(daily.insert().from_select(
+        ['day', 'product_id', 'quantity', 'revenue'],
+        sa.select(sale_day, cart_items.c.product_id, sa.func.sum(cart_items.c.quantity),
+                  sa.func.sum(cart_items.c.quantity * products.c.price))
+        .select_from(cart_items)
+        .join(sales, cart_items.c.sale_id == sales.c.id)
+        .join(products, cart_items.c.product_id == products.c.id)
+        .group_by(sale_day, cart_items.c.product_id)
+    ))
+
+    # Item counts per sale are summed first so a sale is not counted once per line
+    items_per_sale = (
+        sa.select(cart_items.c.sale_id, sa.func.sum(cart_items.c.quantity).label('items_sold'))
+        .group_by(cart_items.c.sale_id)
+        .subquery()
+    )
+    op.execute(hourly.insert().from_select(
+        ['day', 'hour', 'sale_count', 'items_sold', 'revenue'],
+        sa.select(sale_day, sale_hour, sa.func.count(sales.c.id),
+                  sa.func.coalesce(sa.func.sum(items_per_sale.c.items_sold), 0), sa.func.sum(sales.c.total))
+        .select_from(sales)
+        .outerjoin(items_per_sale, items_per_sale.c.sale_id == sales.c.id)
+        .group_by(sale_day, sale_hour)
+    ))
+
+
+def downgrade():
+    op.drop_table('sales_hourly')
+    op.drop_table('sales_daily_product')
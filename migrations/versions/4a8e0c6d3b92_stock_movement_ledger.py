@@ -0,0 +1,53 @@
+"""stock movement ledger and snapshots
+
+Revision ID: 4a8e0c6d3b92
+Revises: 9b4c7d2e1f08
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4a8e0c6d3b92'
+down_revision = '9b4c7d2e1f08'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('stock_movements',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.Enum('SALE', 'RECEIPT', 'ADJUSTMENT', 'CORRECTION', name='movementkind'), nullable=False),
+    sa.Column('quantity', sa.Integer(), nullable=False),
+    sa.Column('sale_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.Column('note', sa.String(length=200), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['sale_id'], ['sales.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_stock_movement_product', 'stock_movements', ['product_id', 'id'], unique=False)
+    op.create_table('stock_snapshots',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('stock', sa.Integer(), nullable=False),
+    sa.Column('movement_id', sa.Integer(), nullable=False),
+    sa.Column('taken_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    # Opening balances: current stock, less hot-product sales the flusher has not applied yet
+    op.execute(sa.text(
+        'INSERT INTO stock_snapshots (product_id, stock, movement_id, taken_at) '
+        'SELECT p.id, p.stock - COALESCE((SELECT SUM(c.quantity) FROM cart_items c '
+        'WHERE c.product_id = p.id AND c.stock_pending = :pending), 0), 0, CURRENT_TIMESTAMP FROM products p'
+    ).bindparams(pending=True))
+
+
+def downgrade():
+    op.drop_table('stock_snapshots')
+    op.drop_index('ix_stock_movement_product', table_name='stock_movements')
+    op.drop_table('stock_movements')
+    sa.Enum(name='movementkind').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,30 @@
+"""per-category catalog version indexes and counters
+
+Revision ID: 5d0e8b3a7c61
+Revises: c2b7e49d0a15
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0e8b3a7c61'
+down_revision = 'c2b7e49d0a15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_product_category_version', 'products', ['category_id', 'catalog_version'], unique=False)
+    op.create_index('ix_tombstone_category_version', 'catalog_tombstones', ['category_id', 'version'], unique=False)
+    # Counters for the category list and for product names shown in reports
+    op.execute('INSERT INTO catalog_state (id, version) VALUES (2, 0)')
+    op.execute('INSERT INTO catalog_state (id, version) VALUES (3, 0)')
+
+
+def downgrade():
+    op.execute('DELETE FROM catalog_state WHERE id IN (2, 3)')
+    op.drop_index('ix_tombstone_category_version', table_name='catalog_tombstones')
+    op.drop_index('ix_product_category_version', table_name='products')
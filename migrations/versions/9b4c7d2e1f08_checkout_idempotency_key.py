@@ -0,0 +1,28 @@
+"""idempotency key on sales
+
+Revision ID: 9b4c7d2e1f08
+Revises: e61f3a9b2c47
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4c7d2e1f08'
+down_revision = 'e61f3a9b2c47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+        batch_op.create_unique_constraint('uq_sales_idempotency_key', ['idempotency_key'])
+
+
+def downgrade():
+    with op.batch_alter_table('sales', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_sales_idempotency_key', type_='unique')
+        batch_op.drop_column('idempotency_key')
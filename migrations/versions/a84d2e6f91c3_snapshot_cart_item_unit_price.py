@@ -0,0 +1,43 @@
+"""snapshot unit price on cart items
+
+Revision ID: a84d2e6f91c3
+Revises: 3f9a1c2d4b10
+Create Date: 2026-10-18 10:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a84d2e6f91c3'
+down_revision = '3f9a1c2d4b10'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade():
+    op.add_column('cart_items', sa.Column('unit_price', sa.Float(), nullable=True))
+
+    # Backfill existing lines from the current catalog price in id-range batches,
+    # so no single statement holds a lock over the whole history
+    conn = op.get_bind()
+    min_id, max_id = conn.execute(sa.text('SELECT MIN(id), MAX(id) FROM cart_items')).first()
+    if min_id is not None:
+        backfill = sa.text(
+            'UPDATE cart_items SET unit_price = '
+            '(SELECT products.price FROM products WHERE products.id = cart_items.product_id) '
+            'WHERE id >= :low AND id < :high AND unit_price IS NULL'
+        )
+        for low in range(min_id, max_id + 1, BACKFILL_BATCH_SIZE):
+            conn.execute(backfill, {'low': low, 'high': low + BACKFILL_BATCH_SIZE})
+
+    with op.batch_alter_table('cart_items') as batch_op:
+        batch_op.alter_column('unit_price', existing_type=sa.Float(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cart_items') as batch_op:
+        batch_op.drop_column('unit_price')
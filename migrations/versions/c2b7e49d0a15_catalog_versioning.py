@@ -0,0 +1,44 @@
+"""catalog versioning for delta sync
+
+Revision ID: c2b7e49d0a15
+Revises: a84d2e6f91c3
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2b7e49d0a15'
+down_revision = 'a84d2e6f91c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('catalog_state',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute('INSERT INTO catalog_state (id, version) VALUES (1, 0)')
+    op.create_table('catalog_tombstones',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_catalog_tombstones_version'), 'catalog_tombstones', ['version'], unique=False)
+    op.add_column('products', sa.Column('catalog_version', sa.Integer(), nullable=False, server_default='0'))
+    op.create_index(op.f('ix_products_catalog_version'), 'products', ['catalog_version'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_products_catalog_version'), table_name='products')
+    with op.batch_alter_table('products') as batch_op:
+        batch_op.drop_column('catalog_version')
+    op.drop_index(op.f('ix_catalog_tombstones_version'), table_name='catalog_tombstones')
+    op.drop_table('catalog_tombstones')
+    op.drop_table('catalog_state')
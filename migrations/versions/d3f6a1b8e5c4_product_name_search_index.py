@@ -0,0 +1,35 @@
+"""product name search index
+
+Revision ID: d3f6a1b8e5c4
+Revises: b7d15e2a8c03
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f6a1b8e5c4'
+down_revision = 'b7d15e2a8c03'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        # FTS5 trigram table kept in sync by app/search.py; needs SQLite 3.34+
+        op.execute("CREATE VIRTUAL TABLE product_search USING fts5(name, tokenize='trigram')")
+        op.execute('INSERT INTO product_search (rowid, name) SELECT id, name FROM products')
+    elif dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute('CREATE INDEX ix_product_name_trgm ON products USING gin (name gin_trgm_ops)')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute('DROP TABLE product_search')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX ix_product_name_trgm')
@@ -0,0 +1,28 @@
+"""pending flag on cart items for write-behind hot stock
+
+Revision ID: e61f3a9b2c47
+Revises: 5d0e8b3a7c61
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e61f3a9b2c47'
+down_revision = '5d0e8b3a7c61'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('cart_items', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('stock_pending', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.create_index(batch_op.f('ix_cart_items_stock_pending'), ['stock_pending'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cart_items', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_cart_items_stock_pending'))
+        batch_op.drop_column('stock_pending')
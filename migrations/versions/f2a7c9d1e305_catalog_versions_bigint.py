@@ -0,0 +1,40 @@
+"""catalog versions as bigint, for transaction-id stamps on postgres
+
+Revision ID: f2a7c9d1e305
+Revises: d3f6a1b8e5c4
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2a7c9d1e305'
+down_revision = 'd3f6a1b8e5c4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite integers are already 64-bit. On PostgreSQL, app/catalog.py stamps products with
+    # txid_current(), which counts every transaction the server has run and outgrows int4. Every
+    # counter stamp already written came from a transaction of its own, so it sits below the
+    # transaction ids that follow it and versions keep increasing across the switch.
+    if op.get_bind().dialect.name == 'postgresql':
+        op.alter_column('products', 'catalog_version', type_=sa.BigInteger(), existing_type=sa.Integer(),
+                        existing_nullable=False)
+        op.alter_column('catalog_tombstones', 'version', type_=sa.BigInteger(), existing_type=sa.Integer(),
+                        existing_nullable=False)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        # Back to a counter row: resume it above every transaction-id stamp
+        op.execute('UPDATE catalog_state SET version = GREATEST(version, '
+                   '(SELECT COALESCE(MAX(catalog_version), 0) FROM products), '
+                   '(SELECT COALESCE(MAX(version), 0) FROM catalog_tombstones)) WHERE id = 1')
+        op.alter_column('catalog_tombstones', 'version', type_=sa.Integer(), existing_type=sa.BigInteger(),
+                        existing_nullable=False)
+        op.alter_column('products', 'catalog_version', type_=sa.Integer(), existing_type=sa.BigInteger(),
+                        existing_nullable=False)
@@ -0,0 +1,84 @@
+# tests/conftest.py
+"""Fixtures: an app on a fresh SQLite database, a fake Redis, a logged-in client and a statement counter."""
+import os
+from contextlib import contextmanager
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import event
+from config import Config
+from app import create_app, db
+from app.checkout import place_sale
+from app.models import User, Role, Category, Product
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f'sqlite:///{tmp_path}/test.db'
+        TESTING = True
+        LOG_FILE = str(tmp_path / 'app.log')
+        RATELIMIT_ENABLED = False
+        SOCKETIO_MESSAGE_QUEUE = None
+        CATALOG_CACHE = False  # Every read goes to SQL, so the counts cover the views' own queries
+        HOT_STOCK_PRODUCTS = []
+        LEDGER_COMPACTION_INTERVAL = 0
+
+    app = create_app(TestConfig)
+    app.extensions['redis'] = None  # Redis-backed caches fall back to SQL
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, 'migrations'))
+        admin = User(username='admin', role=Role.ADMIN)
+        admin.set_password('secret')
+        db.session.add(admin)
+        db.session.commit()
+        seed(products=4, sales=3)
+    # Not left pushed: each request starts with an empty session, as in production
+    return app
+
+
+def seed(products, sales):
+    """Add a category with `products` products, then `sales` two-line sales of them."""
+    category = Category(name=f'Category {Category.query.count() + 1}')
+    db.session.add(category)
+    db.session.flush()
+    added = [Product(name=f'{category.name} item {i}', price=10.0 + i, stock=1000, category_id=category.id)
+             for i in range(products)]
+    db.session.add_all(added)
+    db.session.commit()
+    for i in range(sales):
+        place_sale([{'id': added[i % products].id, 'quantity': 1},
+                    {'id': added[(i + 1) % products].id, 'quantity': 2}])
+
+
+@pytest.fixture
+def fake_redis(app):
+    """Give `app` an in-process Redis in place of the SQL fallbacks."""
+    fakeredis = pytest.importorskip('fakeredis')
+    client = fakeredis.FakeRedis(decode_responses=True)
+    app.extensions['redis'] = client
+    return client
+
+
+@pytest.fixture
+def client(app):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'secret'})
+    return client
+
+
+@contextmanager
+def counting_statements(app):
+    """Collect the SQL statements `app` sends while the block runs."""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
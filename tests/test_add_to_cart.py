@@ -0,0 +1,21 @@
+# tests/test_add_to_cart.py
+"""Quantity validation on /sales/add_to_cart, which runs on every tap without loading the user."""
+import pytest
+
+
+def add(client, quantity):
+    return client.post('/sales/add_to_cart', json={'product_id': 1, 'quantity': quantity})
+
+
+def test_numeric_string_quantity_is_accepted(client):
+    response = add(client, '2')
+    assert response.status_code == 200
+    assert response.json['quantity'] == 2
+    assert response.json['total_price'] == response.json['price'] * 2
+
+
+@pytest.mark.parametrize('quantity', [0, -1, 1.5, '1.5', 'two', None, True, [1]])
+def test_invalid_quantity_is_rejected(client, quantity):
+    response = add(client, quantity)
+    assert response.status_code == 400
+    assert response.json['success'] is False
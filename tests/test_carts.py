@@ -0,0 +1,67 @@
+# tests/test_carts.py
+"""Checkout by server-side cart id: the Redis cart is what gets sold, once."""
+from app import db
+from app.models import Product, Sale
+
+
+def open_cart(client):
+    return client.get('/sales/cart').json['cart_id']
+
+
+def add(client, product_id, quantity):
+    response = client.post('/sales/add_to_cart', json={'product_id': product_id, 'quantity': quantity})
+    assert response.status_code == 200
+    return response.json['cart_id']
+
+
+def stock_of(app, *product_ids):
+    with app.app_context():
+        return {pid: db.session.get(Product, pid).stock for pid in product_ids}
+
+
+def test_checkout_by_cart_id_sells_the_cart_and_rotates_the_id(app, client, fake_redis):
+    cart_id = open_cart(client)
+    before = stock_of(app, 1, 2, 3)
+    assert add(client, 1, 2) == cart_id
+    add(client, 2, 1)
+    add(client, 1, 1)
+    add(client, 3, 4)
+    client.post('/sales/remove_from_cart', json={'product_id': 3})
+
+    response = client.post('/sales/checkout', json={'cart_id': cart_id})
+
+    assert response.status_code == 200
+    with app.app_context():
+        sale = db.session.get(Sale, response.json['sale_id'])
+        assert {item.product_id: item.quantity for item in sale.cart_items} == {1: 3, 2: 1}
+    assert stock_of(app, 1, 2, 3) == {1: before[1] - 3, 2: before[2] - 1, 3: before[3]}
+    assert fake_redis.exists(f'cart:{cart_id}') == 0
+
+    cart = client.get('/sales/cart').json
+    assert cart['cart_id'] != cart_id
+    assert cart['items'] == []
+    # The sold id cannot be sold again
+    assert client.post('/sales/checkout', json={'cart_id': cart_id}).status_code == 404
+
+
+def test_unknown_cart_id_is_not_found(client, fake_redis):
+    open_cart(client)
+    add(client, 1, 1)
+
+    response = client.post('/sales/checkout', json={'cart_id': 'not-this-tills-cart'})
+
+    assert response.status_code == 404
+
+
+def test_expired_cart_is_not_found(app, client, fake_redis):
+    cart_id = open_cart(client)
+    add(client, 1, 1)
+    fake_redis.delete(f'cart:{cart_id}')  # Expired after RESERVATION_TTL without a change
+    with app.app_context():
+        sales = Sale.query.count()
+
+    response = client.post('/sales/checkout', json={'cart_id': cart_id})
+
+    assert response.status_code == 404
+    with app.app_context():
+        assert Sale.query.count() == sales
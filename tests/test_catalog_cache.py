@@ -0,0 +1,56 @@
+# tests/test_catalog_cache.py
+"""The per-worker catalog copy: reads served from memory while an announced version is not visible yet."""
+import pytest
+from app import catalog, catalog_cache
+from tests.conftest import counting_statements
+
+
+@pytest.fixture
+def snapshot(app):
+    snapshot = app.extensions['catalog_cache'] = catalog_cache._Snapshot()
+    snapshot.listening = True  # As if subscribed, so reads skip the periodic version check
+    with app.app_context():
+        catalog_cache.products([1])  # Initial load
+        snapshot.checked_at = float('inf')
+        yield snapshot
+
+
+def test_reads_between_retries_stay_in_memory_while_behind(app, snapshot):
+    # A version announced before the database shows it: a commit not visible yet, or a write above
+    # the PostgreSQL horizon while a long transaction holds it back
+    snapshot.announce(catalog_cache.PRODUCTS, catalog.current_version() + 1)
+
+    with counting_statements(app) as first:
+        catalog_cache.products([1])
+    with counting_statements(app) as later:
+        for _ in range(20):
+            assert catalog_cache.product(1).id == 1
+            catalog_cache.category_products(1)
+
+    assert first  # One sync attempt
+    assert later == []
+    assert snapshot.retry_at > 0
+
+    snapshot.retry_at = 0.0  # The pause has passed
+    with counting_statements(app) as retried:
+        catalog_cache.products([1])
+    assert retried
+
+
+def test_new_announcement_syncs_straight_away(app, snapshot):
+    snapshot.announce(catalog_cache.PRODUCTS, catalog.current_version() + 1)
+    catalog_cache.products([1])
+    assert snapshot.retry_at > 0
+
+    snapshot.announce(catalog_cache.PRODUCTS, catalog.current_version() + 2)
+    with counting_statements(app) as statements:
+        catalog_cache.products([1])
+    assert statements
+
+
+def test_caught_up_copy_reads_without_sql(app, snapshot):
+    with counting_statements(app) as statements:
+        catalog_cache.products([1, 2])
+        catalog_cache.categories()
+    assert statements == []
+    assert snapshot.retry_at == 0.0
@@ -0,0 +1,79 @@
+# tests/test_checkout_batch.py
+"""/sales/checkout/batch: queued sales recorded in one transaction, answered in request order."""
+from datetime import datetime
+from sqlalchemy import update
+from app import db
+from app import checkout
+from app.models import Product, Sale
+
+
+def stock_of(app, *product_ids):
+    with app.app_context():
+        return {pid: db.session.get(Product, pid).stock for pid in product_ids}
+
+
+def sale_count(app):
+    with app.app_context():
+        return Sale.query.count()
+
+
+def test_results_follow_request_order_with_utc_dates(app, client):
+    entries = [
+        {'cart': [{'id': 1, 'quantity': 1}], 'date': '2026-03-02T09:30:00+02:00', 'idempotency_key': 'b-1'},
+        {'cart': [{'id': 2, 'quantity': 3}], 'date': '2026-03-01T12:00:00', 'idempotency_key': 'b-2'},
+        {'cart': [{'id': 1, 'quantity': 2}, {'id': 3, 'quantity': 1}], 'date': '2026-03-01T23:15:00-05:00'},
+    ]
+    before = stock_of(app, 1, 2, 3)
+
+    response = client.post('/sales/checkout/batch', json={'sales': entries})
+
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [result['success'] for result in results] == [True, True, True]
+    with app.app_context():
+        sales = [db.session.get(Sale, result['sale_id']) for result in results]
+        assert [sale.date for sale in sales] == [
+            datetime(2026, 3, 2, 7, 30), datetime(2026, 3, 1, 12, 0), datetime(2026, 3, 2, 4, 15)]
+        assert [sale.idempotency_key for sale in sales[:2]] == ['b-1', 'b-2']
+        assert [sale.total for sale in sales] == [10.0, 33.0, 32.0]
+    assert stock_of(app, 1, 2, 3) == {1: before[1] - 3, 2: before[2] - 3, 3: before[3] - 1}
+
+
+def test_short_entry_is_rejected_on_its_own(app, client):
+    before = stock_of(app, 1, 2)
+    entries = [
+        {'cart': [{'id': 1, 'quantity': 1}]},
+        {'cart': [{'id': 2, 'quantity': before[2] + 1}]},
+    ]
+
+    results = client.post('/sales/checkout/batch', json={'sales': entries}).json['results']
+
+    assert results[0]['success'] is True
+    assert results[1] == {'success': False, 'message': 'Insufficient stock for Category 1 item 1'}
+    assert stock_of(app, 1, 2) == {1: before[1] - 1, 2: before[2]}
+
+
+def test_stock_drained_mid_batch_records_nothing(app, client, monkeypatch):
+    load_products = checkout.load_products
+
+    def drained_after_load(product_ids):
+        products = load_products(product_ids)
+        # Another till sells product 2 down to one unit after the batch has read its stock
+        with db.engine.begin() as connection:
+            connection.execute(update(Product.__table__).where(Product.__table__.c.id == 2).values(stock=1))
+        return products
+
+    monkeypatch.setattr(checkout, 'load_products', drained_after_load)
+    before, sales = stock_of(app, 1, 2), sale_count(app)
+    entries = [
+        {'cart': [{'id': 1, 'quantity': 2}]},
+        {'cart': [{'id': 2, 'quantity': 1}]},
+        {'cart': [{'id': 2, 'quantity': 1}]},
+    ]
+
+    response = client.post('/sales/checkout/batch', json={'sales': entries})
+
+    assert response.status_code == 409
+    assert response.json['success'] is False
+    assert stock_of(app, 1, 2) == {1: before[1], 2: 1}
+    assert sale_count(app) == sales
@@ -0,0 +1,115 @@
+# tests/test_hot_stock.py
+"""Write-behind hot stock: the flusher, and the stock views that read around pending sales."""
+import logging
+import pytest
+from sqlalchemy import update
+from app import db, hot_stock
+from app.checkout import place_sale
+from app.models import Product, CartItem
+
+HOT_ID = 1
+
+
+@pytest.fixture
+def hot(app, fake_redis):
+    app.config['HOT_STOCK_PRODUCTS'] = {HOT_ID}
+    with app.app_context():
+        product = db.session.get(Product, HOT_ID)
+        product.stock = 10
+        db.session.commit()
+    return fake_redis
+
+
+def sell(app, quantity):
+    with app.app_context():
+        place_sale([{'id': HOT_ID, 'quantity': quantity}])
+
+
+def stock_and_pending(app):
+    with app.app_context():
+        pending = CartItem.query.filter_by(product_id=HOT_ID, stock_pending=True).count()
+        return db.session.get(Product, HOT_ID).stock, pending
+
+
+def flush(app):
+    with app.app_context():
+        return hot_stock.flush()
+
+
+def test_sale_is_pending_until_flushed(app, hot):
+    sell(app, 3)
+    assert hot.get('{hotstock}:1') == '7'
+    assert stock_and_pending(app) == (10, 1)
+
+    assert flush(app) == 1
+    assert stock_and_pending(app) == (7, 0)
+
+
+def test_flush_claims_pending_rows_once(app, hot):
+    sell(app, 3)
+    sell(app, 2)
+
+    assert flush(app) == 2
+    assert flush(app) == 0
+    assert stock_and_pending(app) == (5, 0)
+
+
+def test_flush_backs_off_when_another_flusher_claimed_the_rows(app, hot):
+    sell(app, 4)
+    engine_execute = db.session.execute
+
+    def claimed_first(statement, *args, **kwargs):
+        if statement.is_dml and statement.table.name == 'cart_items':
+            # The other worker's flush commits between this one's read and its claim
+            with db.engine.begin() as connection:
+                connection.execute(update(CartItem.__table__).values(stock_pending=False))
+                connection.execute(update(Product.__table__).where(Product.__table__.c.id == HOT_ID)
+                                   .values(stock=Product.__table__.c.stock - 4))
+        return engine_execute(statement, *args, **kwargs)
+
+    with app.app_context():
+        db.session.execute = claimed_first
+        try:
+            assert hot_stock.flush() == 0
+        finally:
+            del db.session.execute
+    assert stock_and_pending(app) == (6, 0)
+
+
+def test_flush_clamps_an_oversold_counter_at_zero(app, hot, caplog, monkeypatch):
+    hot.set('{hotstock}:1', 25)  # A counter that ran ahead of the row, e.g. after a lost reconcile
+    sell(app, 15)
+    monkeypatch.setattr(app.logger, 'disabled', False)  # Alembic's logging config turns it off
+
+    with caplog.at_level(logging.ERROR, logger=app.logger.name):
+        assert flush(app) == 1
+
+    assert stock_and_pending(app) == (0, 0)
+    assert 'oversold' in caplog.text and '{1: 5}' in caplog.text
+
+
+def test_update_stock_checks_stock_net_of_pending_sales(app, client, hot):
+    sell(app, 6)
+
+    assert client.post(f'/stock/update_stock/{HOT_ID}/5').status_code == 400
+    response = client.post(f'/stock/update_stock/{HOT_ID}/4')
+
+    assert response.json == {'success': True, 'stock': 0}
+    assert stock_and_pending(app) == (6, 1)  # The pending sale is still the flusher's to apply
+    flush(app)
+    assert stock_and_pending(app) == (0, 0)
+
+
+def test_edit_product_keeps_pending_sales_and_commits_nothing_on_failure(app, client, hot):
+    sell(app, 3)
+    assert 'value="7"' in client.get(f'/stock/products/{HOT_ID}/edit').get_data(as_text=True)
+    form = {'name': 'Renamed', 'price': '10.0', 'stock': '12', 'original_stock': '7', 'category': '1'}
+
+    with pytest.raises(ValueError):
+        client.post(f'/stock/products/{HOT_ID}/edit', data=dict(form, price='ten'))
+    assert stock_and_pending(app) == (10, 1)
+
+    client.post(f'/stock/products/{HOT_ID}/edit', data=form)
+    assert stock_and_pending(app) == (15, 1)
+    flush(app)
+    assert stock_and_pending(app) == (12, 0)
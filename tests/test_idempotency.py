@@ -0,0 +1,72 @@
+# tests/test_idempotency.py
+"""Idempotency-Key handling on /sales/checkout: a retry answers with the first sale and sells nothing."""
+import pytest
+from app import db, idempotency
+from app.checkout import place_sale
+from app.models import Product, Sale
+
+CART = [{'id': 1, 'quantity': 2}]
+
+
+def checkout(client, key):
+    return client.post('/sales/checkout', json={'cart': CART}, headers={'Idempotency-Key': key})
+
+
+def sales_and_stock(app, key):
+    with app.app_context():
+        return Sale.query.filter_by(idempotency_key=key).count(), db.session.get(Product, 1).stock
+
+
+@pytest.mark.parametrize('with_redis', [False, True], ids=['sql', 'redis'])
+def test_replay_returns_the_first_sale(app, client, request, with_redis):
+    if with_redis:
+        request.getfixturevalue('fake_redis')
+    _, stock = sales_and_stock(app, 'till-1-0001')
+
+    first = checkout(client, 'till-1-0001')
+    replay = checkout(client, 'till-1-0001')
+
+    assert first.status_code == replay.status_code == 200
+    assert replay.json['sale_id'] == first.json['sale_id']
+    assert 'Idempotent-Replayed' not in first.headers
+    assert replay.headers['Idempotent-Replayed'] == 'true'
+    assert sales_and_stock(app, 'till-1-0001') == (1, stock - 2)
+
+
+def test_replay_falls_back_to_sql_once_the_redis_entry_is_gone(app, client, fake_redis):
+    sale_id = checkout(client, 'till-1-0002').json['sale_id']
+    assert fake_redis.get('idempotency:till-1-0002') == str(sale_id)
+
+    fake_redis.delete('idempotency:till-1-0002')  # Expired after IDEMPOTENCY_KEY_TTL
+    replay = checkout(client, 'till-1-0002')
+
+    assert replay.json['sale_id'] == sale_id
+    assert fake_redis.get('idempotency:till-1-0002') == str(sale_id)  # Cached again for the next retry
+    assert sales_and_stock(app, 'till-1-0002')[0] == 1
+
+
+def test_concurrent_duplicate_answers_from_the_stored_sale(app, client, monkeypatch):
+    # The other copy of the request commits between this one's lookup and its insert
+    with app.app_context():
+        sale, _ = place_sale(CART, idempotency_key='till-1-0003')
+        sale_id = sale.id
+    _, stock = sales_and_stock(app, 'till-1-0003')
+    lookup = idempotency.lookup
+    lookups = []
+
+    def racing_lookup(key):
+        lookups.append(key)
+        return None if len(lookups) == 1 else lookup(key)
+
+    monkeypatch.setattr(idempotency, 'lookup', racing_lookup)
+    response = checkout(client, 'till-1-0003')
+
+    assert response.status_code == 200
+    assert response.json['sale_id'] == sale_id
+    assert response.headers['Idempotent-Replayed'] == 'true'
+    assert len(lookups) == 2  # Asked again after the unique key rejected the insert
+    assert sales_and_stock(app, 'till-1-0003') == (1, stock)
+
+
+def test_invalid_key_is_rejected(client):
+    assert checkout(client, 'x' * (idempotency.MAX_KEY_LENGTH + 1)).status_code == 400
@@ -0,0 +1,64 @@
+# tests/test_query_counts.py
+"""Statement counts for the views that use the load profiles in app/loading.py.
+
+Each count includes the logged-in user that Flask-Login loads on every
+request. The same count has to hold after the tables grow, so a profile
+that starts loading rows one at a time fails here.
+"""
+import pytest
+from app.loading import SALE_DETAIL
+from app.models import Sale
+from tests.conftest import counting_statements, seed
+
+
+def statements_for(app, client, url):
+    with counting_statements(app) as statements:
+        response = client.get(url)
+    assert response.status_code == 200, url
+    return len(statements)
+
+
+def assert_flat(app, client, url, expected):
+    assert statements_for(app, client, url) == expected
+    with app.app_context():
+        seed(products=25, sales=30)
+    assert statements_for(app, client, url) == expected
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('/stock/categories', 2),
+    ('/stock/products/new', 2),
+    ('/stock/products/1/edit', 3),  # The product, then the category list
+    ('/sales/sales', 2),
+])
+def test_category_list_views(app, client, url, expected):
+    assert_flat(app, client, url, expected)
+
+
+def test_product_list_view(app, client):
+    assert_flat(app, client, '/stock/products', 2)
+
+
+def test_sale_summary_view(app, client):
+    # Rollup totals, monthly trend, low stock, then the recent sales
+    assert_flat(app, client, '/auth/admin_dashboard', 5)
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('/sales/api/products/1', 3),  # Category version for the ETag, then its products
+    ('/sales/api/categories', 3),
+    ('/sales/reports/daily', 2),
+    ('/sales/reports/filter?start_date=2000-01-01&end_date=2100-01-01', 4),
+])
+def test_sales_and_report_views(app, client, url, expected):
+    assert_flat(app, client, url, expected)
+
+
+def test_sale_detail_serializes_in_two_statements(app):
+    with app.app_context():
+        seed(products=5, sales=12)
+        with counting_statements(app) as statements:
+            sales = [sale.serialize() for sale in Sale.query.options(*SALE_DETAIL).all()]
+    assert len(sales) == 15
+    assert all(len(sale['items']) == 2 for sale in sales)
+    assert len(statements) == 2  # The sales, then every line with its product
@@ -0,0 +1,48 @@
+# tests/test_writer.py
+"""The SQLite single writer: jobs queued together run in one batch transaction."""
+import eventlet
+import pytest
+from app import db
+from app.checkout import place_sale
+from app.models import Product
+from app.writer import sqlite_writer
+
+
+@pytest.fixture
+def writer(app):
+    app.config['SQLITE_SINGLE_WRITER'] = True
+    sqlite_writer.init_app(app)
+    yield sqlite_writer
+    sqlite_writer.enabled = False  # The writer is module-wide; later apps start without it
+
+
+def run_together(app, writer, *jobs):
+    """Queue every job before the writer wakes, so they share one batch; returns the jobs' results."""
+    def submit(job):
+        with app.app_context():
+            return writer.run(job)
+    return list(eventlet.GreenPool().imap(submit, jobs))
+
+
+def test_job_reads_stock_an_earlier_job_in_the_batch_changed(app, writer):
+    with app.app_context():
+        stock = db.session.get(Product, 1).stock
+
+    def sell():
+        product = db.session.get(Product, 1)  # Returned, so it stays in the batch session's identity map
+        place_sale([{'id': 1, 'quantity': 5}])  # A Core UPDATE, which leaves that Product as it was
+        return db.session(), product
+
+    def restock():
+        product = db.session.get(Product, 1)
+        seen = product.stock
+        product.stock += 10
+        db.session.commit()
+        return db.session(), seen
+
+    (sell_session, _), (restock_session, seen) = run_together(app, writer, sell, restock)
+
+    assert sell_session is restock_session  # Both jobs ran in the same batch
+    assert seen == stock - 5
+    with app.app_context():
+        assert db.session.get(Product, 1).stock == stock - 5 + 10